@@ -1,3 +1,2 @@
-from .download import download
-from .scrape import scrape
-from .stream import stream
+# Each action is imported only when it is run (see locdown.py), since between
+# them they import most of the package and all of its dependencies.
@@ -1,8 +1,29 @@
 import json
 from pathlib import Path
 
+from ..jukebox.models import to_json
+from ..progressbar import ProgressBar
+from ..progressbar.widget import Bar, Concurrency, Fraction, Percent, Spinner, Stages
+
 def expand_dest_dir(dest):
   return Path(dest).expanduser() if dest else Path.cwd()
 
 def stringify_metadata(metadata):
-  return json.dumps(metadata, indent=2, sort_keys=True, ensure_ascii=False)
+  return json.dumps(metadata, indent=2, sort_keys=True, ensure_ascii=False, default=to_json)
+
+# A single line of NDJSON (newline-delimited JSON)
+def stringify_metadata_line(metadata):
+  return json.dumps(metadata, sort_keys=True, ensure_ascii=False, default=to_json)
+
+# The progress bar shared by all actions. With an adaptive limiter, the current
+# concurrency limit and its recent history are shown on the right. With
+# `stages`, so is the number of items in each stage of a Pipeline.
+def make_progress_bar(limiter=None, stages=False):
+  right = ([ Stages() ] if stages else []) + ([ Concurrency(limiter) ] if limiter else [])
+  if not right:
+    return ProgressBar(left_fmt='%s %s (%s) %s',
+                       left=[Spinner(), Fraction(), Percent(), Bar()])
+  return ProgressBar(left_fmt='%s %s (%s) %s ',
+                     left=[Spinner(), Fraction(), Percent(), Bar()],
+                     right_fmt='  '.join(len(right) * ['%s']), right=right,
+                     direction=ProgressBar.FormatDirection.RIGHT_TO_LEFT)
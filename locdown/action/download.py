@@ -1,16 +1,20 @@
 from pathlib import Path
-import os, shutil
+import asyncio, os, shutil
 
-from .common import expand_dest_dir, stringify_metadata
-from ..taskbatch import TaskBatch
-from ..progressbar import ProgressBar
-from ..progressbar.widget import Bar, Fraction, Percent, Spinner
-from .. import disclaimer, id, tagger, util
+from .common import expand_dest_dir, make_progress_bar
+from ..artcache import ArtCache
+from ..journal import Journal
+from ..pipeline import Pipeline, Stage
+from ..supervisor import Supervisor
+from ..writer import Writer
+from .. import disclaimer, id, journal as journal_, tagger, util
 from .. import jukebox as jb
-from .scrape import scrape_inner
+from .scrape import save_artist_metadata, save_recording_metadata
 
 def validate_args(args):
-  if not shutil.which('rtmpdump'):
+  if not args.recordings and not args.retry_failed:
+    util.die('No recordings were specified.')
+  elif not shutil.which('rtmpdump'):
     util.die('Dependency rtmpdump not found. Please install it.')
   elif not args.bitrate in [128, 320]:
     util.die('Bitrate must be either 128 or 320.')
@@ -28,56 +32,168 @@ async def download(session, args, max_connections=10):
   elif not disclaimer.accepted() and not disclaimer.ask():
     util.die('You must accept the terms of the disclaimer before using download mode.')
 
-  # Songs for each artist are obtained in shallow format first; full metadata
-  # is fetched just before each recording is downloaded. This is slightly less
-  # efficient than fetching the full data initially, (though it still doesn't take
-  # any extra page requests), but makes the progress indicators more sensible for
-  # the user. Previously, the progress bar would sit still while locdown
-  # fetched all the metadata for an artist's songs at once, which gives the
-  # impression of hanging.
-  recording_metadata, artist_metadata = await scrape_inner(
-      session, args.recordings,
-      dest=args.dest or '' if args.save_json else None,
-      artist_dirs=args.artist_dirs, shallow=True)
-
-  async def download_task(metadata, dest_dir):
-    id_ = metadata.get(jb.keys.ID)
-    tmp_filepath = dest_dir.joinpath(f'{id_}.mp3.tmp')
+  dest_dir = expand_dest_dir(args.dest)
+  art_cache = (ArtCache() if args.cache else ArtCache(path=None)) \
+      if args.tag and args.art else None
+  num_workers = getattr(max_connections, 'maximum', max_connections)
+  supervisor = Supervisor(args.transfers, args.stall_timeout)
+  journal = Journal(dest_dir)
+  writer = Writer(compact=args.compact_json, fsync=args.fsync) if args.save_json else None
+  num_skipped = 0
+
+  # Each recording goes through the stages below, which all run at once, so
+  # that the first downloads start as soon as their metadata has been scraped
+  # rather than after everything has been. Recordings are identified by their
+  # ID and the subdirectory of dest_dir they're downloaded to; their progress
+  # is kept in the journal, and those already downloaded are skipped.
+
+  def not_done(items):
+    nonlocal num_skipped
+    remaining = [ item for item in items if journal.state(*item) != journal_.DONE ]
+    num_skipped += len(items) - len(remaining)
+    return remaining
+
+  def fail(subdir, id_, message):
+    util.eprint(f'warning: {message}')
+    journal.set_state(subdir, id_, journal_.FAILED)
+
+  # Artists are expanded into their recordings from the shallow listing on
+  # their pages; full metadata is scraped per recording in the next stage
+  async def expand(id_):
+    if id_.type_ != id.IDType.ARTIST:
+      return not_done([ ('.', id_.value) ])
+
+    expanded = journal.artist(id_.value)
+    if not expanded:
+      try:
+        artist = await jb.scrape_artist(session, id_.value, shallow=True)
+      except Exception as e:
+        util.eprint(f'warning: Failed to scrape metadata for artist #{id_.value}: {str(e)}')
+        return None
+
+      if args.save_json:
+        await save_artist_metadata(writer, dest_dir, artist, artist_dirs=args.artist_dirs,
+                                   shallow=True)
+      expanded = (f'{artist.id} - {artist.name}',
+                  [ row.id for row in artist.recordings or [] ])
+      journal.set_artist(id_.value, *expanded)
 
+    subdir, ids = expanded
+    dest_dir.joinpath(subdir).mkdir(exist_ok=True)
+    return not_done([ (subdir, recording_id) for recording_id in ids ])
+
+  async def scrape(item):
+    subdir, id_ = item
+    try:
+      metadata = await jb.scrape_recording(session, id_)
+    except Exception as e:
+      fail(subdir, id_, f'Failed to scrape metadata for recording #{id_}: {str(e)}')
+      return None
+
+    # Only recordings requested directly get their own metadata file
+    if args.save_json and subdir == '.':
+      await save_recording_metadata(writer, dest_dir, metadata)
+    journal.set_state(subdir, id_, journal_.SCRAPED)
+    return [ (subdir, metadata) ]
+
+  async def fetch_art(metadata):
+    url = metadata.image_link
+    if not url:
+      return None
     try:
-      await jb.download_recording(id_, args.bitrate, str(tmp_filepath))
+      return await session.retry(art_cache.get, session, url)
+    except Exception as e:
+      util.eprint(f'warning: Failed to fetch album art for recording #{metadata.id}: {str(e)}')
+
+  async def transfer(item):
+    subdir, metadata = item
+    id_ = metadata.id
+    tmp_filepath = dest_dir.joinpath(subdir, f'{id_}.mp3.tmp')
+
+    # Fetch the album art while the recording downloads
+    art_task = asyncio.ensure_future(fetch_art(metadata)) if art_cache else None
+
+    # With --tag-first, the tag is written before the audio instead of after
+    header = tagger.tag_header(metadata, await art_task if art_task else None) \
+        if args.tag and args.tag_first else None
+
+    # A partial file left by an earlier attempt or run is resumed, unless the
+    # tag is written first (rtmpdump can only resume files it wrote itself).
+    # If resuming fails, the next attempt starts over.
+    async def download_recording():
+      await session.throttle()
+      resume = not header and tmp_filepath.is_file()
+      try:
+        await jb.download_recording(id_, args.bitrate, str(tmp_filepath), header, supervisor,
+                                    resume=resume)
+      except RuntimeError:
+        if resume and tmp_filepath.is_file():
+          tmp_filepath.unlink()
+        raise
+
+    journal.set_state(subdir, id_, journal_.TRANSFERRING)
+    try:
+      await session.retry(download_recording)
     except RuntimeError as e:
-      util.eprint(f'warning: Failed to download recording #{id_}: {str(e)}')
-      if tmp_filepath.is_file():
-        tmp_filepath.unlink()
-      return
+      fail(subdir, id_, f'Failed to download recording #{id_}: {str(e)}')
+      if art_task:
+        art_task.cancel()
+      return None
+
+    return [ (subdir, metadata, tmp_filepath, art_task, header) ]
 
+  async def tag(item):
+    subdir, metadata, tmp_filepath, art_task, header = item
+    if args.tag and not header:
+      await tagger.tag(tmp_filepath, metadata, await art_task if art_task else None)
+    journal.set_state(subdir, metadata.id, journal_.TAGGED)
+    return [ (subdir, metadata, tmp_filepath) ]
+
+  async def finalize(item):
+    subdir, metadata, tmp_filepath = item
     if args.tag:
-      await tagger.tag(tmp_filepath, metadata, session if args.art else None)
-      final_filepath = dest_dir.joinpath(tagger.make_filename(metadata))
+      final_filepath = dest_dir.joinpath(subdir, tagger.make_filename(metadata))
     else:
-      final_filepath = tmp_filepath.with_suffix('.mp3')
+      final_filepath = dest_dir.joinpath(subdir, str(metadata.id))
 
     tmp_filepath.rename(Path(str(final_filepath) + '.mp3'))
+    journal.set_state(subdir, metadata.id, journal_.DONE)
+    return []
 
-  async def download_task_unshallow(metadata, dest_dir):
-    return await download_task(await jb.scrape_recording(session, metadata.get(jb.keys.ID)), dest_dir)
-
-  dest_dir = expand_dest_dir(args.dest)
-  tasks = [ download_task(md, dest_dir) \
-            for md in recording_metadata ]
-  for artist in artist_metadata:
-    artist_dest_dir = dest_dir.joinpath(
-        f'{artist.get(jb.keys.ID)} - {artist.get(jb.keys.REF_NAME)}')
-    tasks += [ download_task_unshallow(md, artist_dest_dir) \
-               for md in artist.get(jb.keys.RECORDINGS) or [] ]
-
-  bar = ProgressBar(left_fmt='%s %s (%s) %s',
-                    left=[Spinner(), Fraction(), Percent(), Bar()])
+  bar = make_progress_bar(session.limiter, stages=True)
   monitor = lambda state: util.eprint(f'\r{bar(state)}',
       end='\n' if state.num_total == state.num_done else '')
 
-  util.eprint('Downloading recordings...')
-  batch = TaskBatch(tasks, limit=max_connections,
-                    monitor=monitor, monitor_interval=bar.update_interval)
-  await batch.run()
+  stages = [
+      Stage('scrape', scrape, num_workers),
+      Stage('transfer', transfer, supervisor.max_processes),
+      Stage('tag', tag, args.tag_workers),
+      Stage('finalize', finalize, 1),
+  ]
+
+  with journal:
+    if args.retry_failed:
+      items = journal.failed()
+      util.eprint(f'Retrying {len(items)} failed {util.pluralize("recording", len(items))}...')
+    else:
+      stages.insert(0, Stage('expand', expand, num_workers))
+      items = await id.expand_ids(session, args.recordings)
+      util.eprint('Downloading recordings...')
+
+    pipeline = Pipeline(stages, monitor=monitor, monitor_interval=bar.update_interval)
+    try:
+      await pipeline.run(items)
+    finally:
+      if writer:
+        await writer.close()
+
+  if num_skipped:
+    util.eprint(f'Skipped {num_skipped} {util.pluralize("recording", num_skipped)} ' + \
+                f'already downloaded to {dest_dir}.')
+
+  totals = supervisor.totals
+  if supervisor.num_run:
+    util.eprint(f'Transferred {totals.bytes / 2**20:.1f} MiB in {supervisor.num_run} ' + \
+                f'{util.pluralize("run", supervisor.num_run)} of rtmpdump ' + \
+                f'({totals.duration:.0f}s total, {totals.cpu_time:.1f}s CPU' + \
+                (f', {supervisor.num_killed} killed after stalling' if supervisor.num_killed else '') + ')')
@@ -0,0 +1,32 @@
+from .scrape import scrape_inner
+from .sync import content_hash
+from .. import catalog, id, util
+from .. import jukebox as jb
+
+async def index(session, args):
+  if args.index_action == 'build':
+    # Each record is also marked as synced, as is everything up to the highest
+    # ID of each type asked for, so that `sync` only has to look beyond that
+    with catalog.Catalog(args.db) as cat:
+      max_ids = { type_: 0 for type_ in id.IDType }
+
+      def mark_synced(type_, md):
+        cat.set_sync_hash(type_.value, md.id, content_hash(md))
+
+      def on_result(md):
+        type_ = id.IDType.ARTIST if isinstance(md, jb.Artist) else id.IDType.RECORDING
+        if type_ == id.IDType.ARTIST:
+          cat.add_artist(md)
+          for rmd in md.recordings or []:
+            if rmd.artists is not None: # Added along with the artist; see Catalog.add_artist
+              mark_synced(id.IDType.RECORDING, rmd)
+        else:
+          cat.add_recording(md)
+        mark_synced(type_, md)
+        max_ids[type_] = max(max_ids[type_], md.id)
+
+      await scrape_inner(session, args.recordings, on_result=on_result,
+          max_connections=session.limiter or args.max_connections)
+      for type_, max_id in max_ids.items():
+        cat.set_synced_max_id(type_.value, max(max_id, cat.synced_max_id(type_.value)))
+    util.eprint(f'Saved to {args.db}')
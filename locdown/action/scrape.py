@@ -1,73 +1,85 @@
-from pathlib import Path
 import os
 
-from .common import expand_dest_dir, stringify_metadata
+from .common import expand_dest_dir, make_progress_bar, stringify_metadata, stringify_metadata_line
 from ..taskbatch import TaskBatch
-from ..progressbar import ProgressBar
-from ..progressbar.widget import Bar, Fraction, Percent, Spinner
+from ..pack import Pack
+from ..writer import FSYNC_NEVER, Writer, make_encoder
 from .. import id, tagger, util
 from .. import jukebox as jb
 
 MISC_RECORDINGS_ARTIST = 'Various Artists'
 
 def validate_args(args):
-  if args.artist_dirs and not args.save_json:
+  if args.pack and args.save_json:
+    util.die('--pack cannot be used with -j/--save-json')
+  elif args.pack and args.artist_dirs:
+    util.die('-r/--artist-dirs cannot be used with --pack; use it with `unpack` instead')
+  elif args.pack and args.format == 'ndjson':
+    util.die('--format ndjson cannot be used with --pack')
+  elif args.artist_dirs and not args.save_json:
     util.die('-r/--artist-dirs must be used with -j/--save-json')
+  elif args.format == 'ndjson' and args.save_json:
+    util.die('--format ndjson cannot be used with -j/--save-json')
   elif args.dest and not os.path.exists(args.dest):
     util.die(f'The destination specified by -d/--dest does not exist: {args.dest}')
   elif args.dest and not os.path.isdir(args.dest):
     util.die(f'The destination specified by -d/--dest exists, but is not a directory: {args.dest}')
 
-def write_metadata(filepath, md):
-  with Path(str(filepath) + '.json').open('w', encoding='utf-8') as f:
-    f.write(stringify_metadata(md))
-    f.write('\n')
-
-def save_artist_metadata(dest_dir, md, artist_dirs=False, shallow=False):
+# Metadata files are written by `writer` (see writer.py) in the background
+async def save_artist_metadata(writer, dest_dir, md, artist_dirs=False, shallow=False):
   name = tagger.make_dirname(md)
   path = dest_dir.joinpath(name)
   if artist_dirs:
-    path.mkdir(exist_ok=True)
-    for rmd in md.get(jb.keys.RECORDINGS):
+    for rmd in md.recordings:
       filename = tagger.make_filename(rmd, md)
-      write_metadata(path.joinpath(filename), rmd)
-    mdw = dict(md)
+      await writer.write_json(path.joinpath(filename), rmd)
+    mdw = md.to_dict()
     del mdw[jb.keys.RECORDINGS]
-    write_metadata(path.joinpath('artist'), mdw)
+    await writer.write_json(path.joinpath('artist'), mdw)
   else:
-    write_metadata(path, md)
+    await writer.write_json(path, md)
 
-def save_recording_metadata(dest_dir, md):
+async def save_recording_metadata(writer, dest_dir, md):
   filepath = dest_dir.joinpath(tagger.make_filename(md))
-  write_metadata(filepath, md)
+  await writer.write_json(filepath, md)
 
-async def scrape_inner(session, recordings, dest=None, artist_dirs=False, shallow=False):
+# If `on_result` is given, each result is passed to it as soon as it has been
+# scraped and is not kept in the returned metadata. With `dest`, metadata is
+# also saved there by `writer`, or added to `pack` (see pack.py) if given.
+async def scrape_inner(session, recordings, dest=None, artist_dirs=False, shallow=False,
+                       on_result=None, max_connections=10, writer=None, pack=None):
   dest_dir = expand_dest_dir(dest) if dest else None
+  encode_record = make_encoder(compact=True) if pack is not None else None
   expanded_ids = await id.expand_ids(session, recordings)
+  counts = { id_type: expanded_ids.count(id_type) for id_type in id.IDType }
 
-  normalized_ids = {}
-  for id_type in list(id.IDType):
-    ids_of_type = [ id_.value for id_ in expanded_ids if id_.type_ == id_type ]
-    if ids_of_type:
-      normalized_ids[id_type] = ids_of_type
-
-  bar = ProgressBar(left_fmt='%s %s (%s) %s',
-                    left=[Spinner(), Fraction(), Percent(), Bar()])
+  bar = make_progress_bar(session.limiter)
   monitor = lambda state: util.eprint(f'\r{bar(state)}',
       end='\n' if state.num_total == state.num_done else '')
 
-  def scrape_metadata_task(scrape_fn, id_type):
-    tasks = map(scrape_fn, normalized_ids.get(id_type))
-    batch = TaskBatch(tasks, monitor=monitor, monitor_interval=bar.update_interval)
-    return batch.run()
+  async def scrape_metadata_task(scrape_fn, id_type):
+    ids = expanded_ids.of_type(id_type)
+    batch = TaskBatch(map(scrape_fn, ids), limit=max_connections, total=counts[id_type],
+                      monitor=monitor, monitor_interval=bar.update_interval)
+    if on_result:
+      async for _ in batch:
+        pass
+      return []
+    return await batch.run()
 
   artist_metadata = {}
-  if id.IDType.ARTIST in normalized_ids:
+  if counts[id.IDType.ARTIST]:
     async def scrape_fn(id_):
       try:
         result = await jb.scrape_artist(session, id_, shallow)
-        if dest_dir:
-          save_artist_metadata(dest_dir, result, artist_dirs=artist_dirs, shallow=shallow)
+        if pack is not None:
+          pack.add(id.IDType.ARTIST.value, id_, encode_record(result))
+        elif dest_dir:
+          await save_artist_metadata(writer, dest_dir, result, artist_dirs=artist_dirs,
+                                     shallow=shallow)
+        if on_result:
+          on_result(result)
+          return None
         return result
       except Exception as e:
         util.eprint(f'warning: Failed to scrape metadata for artist #{id_}: {str(e)}')
@@ -76,12 +88,17 @@ async def scrape_inner(session, recordings, dest=None, artist_dirs=False, shallo
     artist_metadata = await scrape_metadata_task(scrape_fn, id.IDType.ARTIST)
 
   recording_metadata = {}
-  if id.IDType.RECORDING in normalized_ids:
+  if counts[id.IDType.RECORDING]:
     async def scrape_fn(id_):
       try:
         result = await jb.scrape_recording(session, id_)
-        if dest_dir:
-          save_recording_metadata(dest_dir, result)
+        if pack is not None:
+          pack.add(id.IDType.RECORDING.value, id_, encode_record(result))
+        elif dest_dir:
+          await save_recording_metadata(writer, dest_dir, result)
+        if on_result:
+          on_result(result)
+          return None
         return result
       except Exception as e:
         util.eprint(f'warning: Failed to scrape metadata for recording #{id_}: {str(e)}')
@@ -93,19 +110,41 @@ async def scrape_inner(session, recordings, dest=None, artist_dirs=False, shallo
 
 def finalize_metadata(artist_metadata, recording_metadata, artist_dirs=False):
   if artist_dirs or (artist_metadata and recording_metadata):
-    artist_metadata.append({
-        jb.keys.REF_NAME: MISC_RECORDINGS_ARTIST,
-        jb.keys.RECORDINGS: recording_metadata
-    })
+    artist_metadata.append(jb.Artist(name=MISC_RECORDINGS_ARTIST, recordings=recording_metadata))
   return [ md for md in artist_metadata or recording_metadata if md != None ]
 
 async def scrape(session, args):
   validate_args(args)
 
-  dest = args.dest or '' if args.save_json else None
-  recording_metadata, artist_metadata = await scrape_inner(
-      session, args.recordings,
-      dest=dest, artist_dirs=args.artist_dirs, shallow=args.shallow)
+  dest = args.dest or '' if args.save_json or args.pack else None
+
+  if args.pack:
+    with Pack(expand_dest_dir(dest)) as pack:
+      # Results are only added to the pack, rather than also kept in memory
+      await scrape_inner(session, args.recordings, dest=dest, shallow=args.shallow,
+          on_result=lambda md: None, max_connections=session.limiter or args.max_connections,
+          pack=pack)
+      if args.fsync != FSYNC_NEVER:
+        pack.sync()
+    util.eprint(f'The pack in {pack.path} now holds {len(pack)} ' + \
+                f'{util.pluralize("record", len(pack))}.')
+    return
+
+  if args.format == 'ndjson':
+    await scrape_inner(session, args.recordings, shallow=args.shallow,
+        on_result=lambda md: print(stringify_metadata_line(md), flush=True),
+        max_connections=session.limiter or args.max_connections)
+    return
+
+  writer = Writer(compact=args.compact_json, fsync=args.fsync) if args.save_json else None
+  try:
+    recording_metadata, artist_metadata = await scrape_inner(
+        session, args.recordings,
+        dest=dest, artist_dirs=args.artist_dirs, shallow=args.shallow,
+        max_connections=session.limiter or args.max_connections, writer=writer)
+  finally:
+    if writer:
+      await writer.close()
 
   if not args.save_json:
     print(stringify_metadata(finalize_metadata(artist_metadata, recording_metadata)))
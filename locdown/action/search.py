@@ -0,0 +1,38 @@
+import json, re, sqlite3
+
+from .common import stringify_metadata
+from .. import catalog, util
+
+YEARS_REGEX = re.compile(r'^(\d{4})(?:-(\d{4})|(s))?$')
+
+def parse_years(arg):
+  match = YEARS_REGEX.match(arg)
+  if not match:
+    util.die(f'Invalid year or range of years: {arg}')
+  first, last, decade = match.groups()
+  first = int(first)
+  if decade:
+    return first, first + 9
+  return first, int(last) if last else first
+
+def search(args):
+  if not args.db.is_file():
+    util.die(f'No catalog found at {args.db}; create one with `locdown index build`.')
+
+  text = ' '.join(args.query)
+  with catalog.Catalog(args.db) as cat:
+    try:
+      results = cat.search(text=text, artist=args.artist, role=args.role,
+          language=args.language, genre=args.genre,
+          years=parse_years(args.years) if args.years else None, limit=args.limit)
+    except sqlite3.OperationalError as e:
+      util.die(f'Invalid search query `{text}` ({str(e)}). Quote words containing ' + \
+               'punctuation, e.g. "rag-time", and don\'t end a query with AND, OR or NOT.')
+
+  if args.format == 'ids':
+    print(' '.join(str(id_) for id_, _, _, _ in results))
+  elif args.format == 'json':
+    print(stringify_metadata([ json.loads(md) for _, _, _, md in results ]))
+  else:
+    for id_, date, title, _ in results:
+      print(f'{id_}\t{date or ""}\t{title or ""}')
@@ -1,6 +1,5 @@
-import asyncio
-
 from .. import id, jukebox, util
+from ..taskbatch import TaskBatch
 
 async def stream(session, args):
   expanded_ids = await id.expand_ids(session, args.recordings)
@@ -8,11 +7,12 @@ async def stream(session, args):
   async def normalize_id(id_):
     if id_.type_ == id.IDType.ARTIST:
       metadata = await jukebox.scrape_artist(session, id_.value, shallow=True)
-      return [ entry.get(jukebox.keys.ID) for entry in metadata.get(jukebox.keys.RECORDINGS) ]
+      return [ entry.id for entry in metadata.recordings ]
     else:
       return [ id_.value ]
 
-  normalized_ids = util.flatten(await asyncio.gather(*map(normalize_id, expanded_ids)))
+  batch = TaskBatch(map(normalize_id, expanded_ids), limit=session.limiter or args.max_connections)
+  normalized_ids = util.flatten(await batch.run())
   urls = map(lambda id_: jukebox.url.id_to_stream_url(id_, args.bitrate), normalized_ids)
 
   if (args.print):
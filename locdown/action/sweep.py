@@ -0,0 +1,30 @@
+from .common import make_progress_bar
+from ..taskbatch import TaskBatch
+from .. import id, idmap, util
+from .. import jukebox as jb
+
+# Probes every ID up to the current maximum whose existence is not yet known
+# (or every ID, with `recheck`), filling in the session's ID map.
+async def sweep(session, args):
+  bar = make_progress_bar(session.limiter)
+  monitor = lambda state: util.eprint(f'\r{bar(state)}',
+      end='\n' if state.num_total == state.num_done else '')
+
+  for type_ in id.IDType:
+    domain = type_.value + 's'
+    max_id = await id.update_max_id(type_, session)
+    ids = [ id_ for id_ in range(1, max_id+1)
+            if args.recheck or session.id_map.state(domain, id_) == idmap.UNKNOWN ]
+
+    async def check(id_):
+      try:
+        return await session.retry(jb.id_exists, session, id_, domain)
+      except Exception as e:
+        util.eprint(f'warning: Failed to check {type_.value} #{id_}: {str(e)}')
+
+    util.eprint(f'Sweeping {type_.value}s...')
+    batch = TaskBatch(map(check, ids), limit=session.limiter or args.max_connections,
+                      total=len(ids), monitor=monitor, monitor_interval=bar.update_interval)
+    results = await batch.run()
+    util.eprint(f'{results.count(False)} of {len(ids)} {type_.value} IDs checked do not exist.')
+    session.id_map.save()
@@ -0,0 +1,80 @@
+import hashlib, json
+
+from .common import make_progress_bar, stringify_metadata_line
+from ..resilience import transient_errors
+from ..taskbatch import TaskBatch
+from .. import catalog, id, util
+from .. import jukebox as jb
+
+CHANGE_ADDED = 'added'
+CHANGE_CHANGED = 'changed'
+CHANGE_REMOVED = 'removed'
+
+# Artists are hashed with their recordings reduced to IDs, so that an artist
+# hashes the same whether it was scraped shallowly (as here) or deeply (by
+# `index build`); changes to the recordings themselves are caught by theirs.
+def content_hash(metadata):
+  if isinstance(metadata, jb.Artist) and metadata.recordings is not None:
+    metadata = metadata.to_dict()
+    metadata[jb.keys.RECORDINGS] = [ rmd[jb.keys.ID] for rmd in metadata[jb.keys.RECORDINGS] ]
+  return hashlib.sha256(json.dumps(metadata, sort_keys=True, ensure_ascii=False,
+                                  default=jb.models.to_json).encode('utf-8')).hexdigest()
+
+def print_change(change, type_, id_, metadata=None):
+  entry = { 'change': change, 'type': type_.value, 'id': id_ }
+  if metadata:
+    entry['metadata'] = metadata
+  print(stringify_metadata_line(entry), flush=True)
+
+# Brings the catalog up to date with loc.gov. IDs published since the last sync
+# are found from the current maximum IDs, and the `verify` least recently
+# checked records of each type are re-scraped to pick up edits and removals.
+# Each addition, change and removal is printed as a line of NDJSON.
+async def sync(session, args):
+  bar = make_progress_bar(session.limiter)
+  monitor = lambda state: util.eprint(f'\r{bar(state)}',
+      end='\n' if state.num_total == state.num_done else '')
+
+  with catalog.Catalog(args.db) as cat:
+    for type_ in id.IDType:
+      domain = type_.value + 's'
+      max_id = await id.update_max_id(type_, session)
+      synced_max_id = cat.synced_max_id(type_.value)
+      ids = cat.least_recently_checked(type_.value, args.verify) + \
+            list(range(synced_max_id + 1, max_id + 1))
+      failed = [] # New IDs that couldn't be checked, to be tried again next time
+
+      async def check(id_):
+        try:
+          metadata = await (jb.scrape_artist(session, id_, shallow=True) \
+              if type_ == id.IDType.ARTIST else jb.scrape_recording(session, id_))
+        except Exception as e:
+          try:
+            exists = isinstance(e, transient_errors()) or await jb.id_exists(session, id_, domain)
+          except Exception:
+            exists = True # Couldn't tell, so leave it be until the next sync
+          if exists:
+            util.eprint(f'warning: Failed to check {type_.value} #{id_}: {str(e)}')
+            if id_ > synced_max_id:
+              failed.append(id_)
+          elif cat.sync_hash(type_.value, id_):
+            (cat.remove_artist if type_ == id.IDType.ARTIST else cat.remove_recording)(id_)
+            cat.remove_sync_record(type_.value, id_)
+            print_change(CHANGE_REMOVED, type_, id_)
+          return
+
+        old_hash = cat.sync_hash(type_.value, id_)
+        new_hash = content_hash(metadata)
+        cat.set_sync_hash(type_.value, id_, new_hash)
+        if old_hash != new_hash:
+          (cat.add_artist if type_ == id.IDType.ARTIST else cat.add_recording)(metadata)
+          print_change(CHANGE_ADDED if not old_hash else CHANGE_CHANGED, type_, id_, metadata)
+
+      util.eprint(f'Syncing {type_.value}s...')
+      batch = TaskBatch(map(check, ids), limit=session.limiter or args.max_connections,
+                        total=len(ids), monitor=monitor, monitor_interval=bar.update_interval)
+      await batch.run()
+      # New IDs are only synced up to the first that failed, since nothing else
+      # would bring it back; any after it are checked again too
+      cat.set_synced_max_id(type_.value,
+          min(failed) - 1 if failed else max(max_id, synced_max_id))
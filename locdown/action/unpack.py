@@ -0,0 +1,34 @@
+import os
+
+from .common import expand_dest_dir
+from .scrape import save_artist_metadata, save_recording_metadata
+from ..pack import ARTIST, Pack, is_pack
+from ..writer import Writer
+from .. import util
+from .. import jukebox as jb
+
+def validate_args(args):
+  if not is_pack(args.pack):
+    util.die(f'No pack found in {args.pack}; create one with `locdown scrape --pack`.')
+  elif args.dest and not os.path.exists(args.dest):
+    util.die(f'The destination specified by -d/--dest does not exist: {args.dest}')
+  elif args.dest and not os.path.isdir(args.dest):
+    util.die(f'The destination specified by -d/--dest exists, but is not a directory: {args.dest}')
+
+# Writes out the metadata in a pack as individual JSON files, exactly as
+# `scrape --save-json` would have
+async def unpack(args):
+  validate_args(args)
+  dest_dir = expand_dest_dir(args.dest)
+
+  with Pack(args.pack) as pack:
+    async with Writer(compact=args.compact_json, fsync=args.fsync) as writer:
+      for type_, id_ in pack.keys():
+        metadata = pack.get(type_, id_)
+        if type_ == ARTIST:
+          await save_artist_metadata(writer, dest_dir, jb.Artist.from_dict(metadata),
+                                     artist_dirs=args.artist_dirs)
+        else:
+          await save_recording_metadata(writer, dest_dir, jb.Recording.from_dict(metadata))
+
+  util.eprint(f'Unpacked {len(pack)} {util.pluralize("record", len(pack))} to {dest_dir}.')
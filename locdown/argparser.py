@@ -1,6 +1,6 @@
-import argparse, re
+import argparse, pathlib, re
 
-from . import disclaimer, id, jukebox
+from . import config, disclaimer, id, jukebox
 
 class DisclaimerAction(argparse.Action):
   def __call__(self, parser, namespace, values, option_string=None):
@@ -10,8 +10,22 @@ class DisclaimerAction(argparse.Action):
 ID_RANGE_REGEX = re.compile('^(\d+)-(\d+)$')
 ID_RANDOM_REGEX = re.compile('^random(\d+)?$')
 ID_ARTIST_PREFIX = 'artist:'
+ID_EXCLUSION_PREFIX = '!'
+ID_INTERSECTION_SEPARATOR = '&'
+DEFAULT_SYNC_VERIFY = 200 # Per ID type
+DEFAULT_TAG_WORKERS = 4 # Files tagged at once during downloads
 
 def parse_recordings_argument(arg):
+  if arg.startswith(ID_EXCLUSION_PREFIX):
+    spec = parse_recordings_argument(arg[len(ID_EXCLUSION_PREFIX):])
+    return id.IDExclusion(spec, spec.type_)
+
+  if ID_INTERSECTION_SEPARATOR in arg:
+    specs = tuple(map(parse_recordings_argument, arg.split(ID_INTERSECTION_SEPARATOR)))
+    if len({ spec.type_ for spec in specs }) > 1:
+      raise ValueError('Recording and artist IDs cannot be intersected')
+    return id.IDIntersection(specs, specs[0].type_)
+
   type_ = id.IDType.RECORDING
   if arg.startswith(ID_ARTIST_PREFIX):
     arg = arg[len(ID_ARTIST_PREFIX):]
@@ -30,21 +44,59 @@ def parse_recordings_argument(arg):
     count = int(match.group(1)) if match.group(1) else 1
     return id.IDRandom(count, type_)
 
-  id_, type_ = jukebox.url.url_to_id(arg)
-  return ID(id_, type_)
+  id_, domain = jukebox.url.url_to_id(arg)
+  return id.ID(id_, id.IDType(domain.rstrip('s')))
+
+def parse_max_connections(arg):
+  if arg == 'auto':
+    return arg
+  return int(arg)
+
+def parse_positive_int(arg):
+  value = int(arg)
+  if value < 1:
+    raise argparse.ArgumentTypeError(f'must be at least 1: {arg}')
+  return value
 
-def add_recordings_argument(parser, verb):
-  parser.add_argument('recordings', metavar='recording', nargs='+', default=[],
+def add_recordings_argument(parser, verb, nargs='+'):
+  parser.add_argument('recordings', metavar='recording', nargs=nargs, default=[],
       type=parse_recordings_argument,
       help=f'The recording(s) to {verb}; see below for details.')
 
+def add_cache_arguments(parser):
+  parser.add_argument('--cache', dest='cache', action='store_true', help=
+      'Cache fetched details pages on disk and reuse them on later runs (default).')
+  parser.add_argument('--no-cache', dest='cache', action='store_false', help=
+      'Always fetch details pages from loc.gov, bypassing the page cache.')
+  parser.add_argument('--cache-ttl', type=int, default=config.DEFAULT_CACHE_TTL,
+      metavar='SECONDS', help=
+      'How long a cached page is used before it is revalidated with loc.gov. ' + \
+      'Defaults to one week.')
+  parser.set_defaults(cache=True)
+
+def add_json_arguments(parser):
+  parser.add_argument('--compact-json', action='store_true', help=
+      'With -j/--save-json, write each JSON file on a single line rather than indented.')
+  parser.add_argument('--fsync', choices=config.FSYNC_POLICIES, default=config.FSYNC_NEVER, help=
+      'With -j/--save-json, when to flush JSON files to disk: `never` leaves it to ' + \
+      'the OS, `batch` flushes them in batches as they are written, and `always` ' + \
+      f'flushes each one as it is written. Defaults to {config.FSYNC_NEVER}.')
+
+def add_db_argument(parser):
+  parser.add_argument('--db', type=pathlib.Path, default=config.CATALOG_PATH, help=
+      'The catalog database to use. Defaults to catalog.sqlite in the user data directory.')
+
 EPILOG=\
 '''Recordings can be specified in a combination of the following formats:
 - A details page URL: `https://loc.gov/jukebox/recordings/detail/id/1234`
 - A plain ID: `1234`
 - A range of IDs (inclusive): `123-234`
 - One or more randomly-selected IDs: `randomN` for `N` IDs, e.g. `random10`. 
-  `random1` can be abbreviated as `random`.\n
+  `random1` can be abbreviated as `random`.
+- Any of the above prefixed with `!`, to exclude those IDs, e.g. `!150-160`
+- Several of the above joined by `&`, for only the IDs in all of them, e.g.
+  `1-5000&random100`\n
+Each ID is only used once, even if several of the above include it.\n
 Artist IDs can also be specified
 - An details page URL: `https://loc.gov/jukebox/artists/detail/id/1234`
 - A plain ID, range of IDs, or random selection of IDs prefixed with `artist:`
@@ -61,8 +113,36 @@ def make_arg_parser():
     root = argparse.ArgumentParser(prog='locdown', description=
         'Fetch audio and metadata from the Library of Congress Jukebox\n' + \
         '(https://www.loc.gov/jukebox).')
-    root.add_argument('-m', '--max-connections', type=int, default=10, help=
-        'The maximum number of simultaneous connections to make. Defaults to 10.')
+    root.add_argument('-m', '--max-connections', type=parse_max_connections, default=10, help=
+        'The maximum number of simultaneous connections to make, shared fairly ' + \
+        'between the items being worked on, or `auto` to adjust it continuously ' + \
+        'based on how loc.gov responds. Defaults to 10.')
+    root.add_argument('--rate', type=float, metavar='REQ/S', help=
+        'The maximum average number of requests per second to make to loc.gov, ' + \
+        'including album art fetches and rtmpdump launches. Unlimited by default.')
+    root.add_argument('--burst', type=int, default=1, metavar='N', help=
+        'The number of requests that may be made back-to-back, before --rate ' + \
+        'applies, after a period without requests. Defaults to 1.')
+    root.add_argument('--retries', type=int, default=config.DEFAULT_RETRIES, help=
+        'How many times to retry a page fetch or download that failed transiently, ' + \
+        f'e.g. due to a timeout or an overloaded server. Defaults to {config.DEFAULT_RETRIES}.')
+    root.add_argument('--backoff', type=float, default=config.DEFAULT_BACKOFF,
+        metavar='SECONDS', help=
+        'The delay before the first retry, which is doubled for each subsequent ' + \
+        f'retry (with random jitter). Defaults to {config.DEFAULT_BACKOFF}.')
+    root.add_argument('--parser', choices=['auto', *jukebox.backend.BACKENDS], default='auto', help=
+        'The HTML parser used to scrape pages. `auto` uses lxml if it is installed, ' + \
+        'falling back to html5lib. Defaults to auto.')
+    root.add_argument('--full-parse', action='store_true', help=
+        'Parse whole pages rather than only the regions that are scraped.')
+    root.add_argument('--parse-workers', type=int, default=0, metavar='N', help=
+        'Parse pages in a pool of N worker processes, so that parsing runs in ' + \
+        'parallel with network I/O. Defaults to 0, which parses in the main process.')
+
+    root.add_argument('--probe-width', type=parse_positive_int, default=jukebox.DEFAULT_PROBE_WIDTH,
+        metavar='N', help=
+        'The number of IDs to check at once when finding the highest recording or ' + \
+        f'artist ID, e.g. for `random`. Defaults to {jukebox.DEFAULT_PROBE_WIDTH}.')
 
     subparsers = root.add_subparsers(dest='action', metavar='action', required=True)
 
@@ -73,6 +153,7 @@ def make_arg_parser():
         'Desired bitrate, in kbps. Can be 128 or 320. Defaults to 320.')
     stream.add_argument('-p', '--print', action='store_true', help=
         'Print stream URLs instead of opening them.')
+    add_cache_arguments(stream)
     add_recordings_argument(stream, 'stream')
 
     scrape = subparsers.add_parser('scrape', epilog=EPILOG,
@@ -88,6 +169,16 @@ def make_arg_parser():
         'Save individual JSON data files for each recording instead of printing.')
     scrape.add_argument('-d', '--dest', type=str, default='.', help=
         'Destination directory for downloaded data files. Use with the -s flag.')
+    scrape.add_argument('-f', '--format', choices=['json', 'ndjson'], default='json', help=
+        'Output format when printing. `json` prints a single array once scraping ' + \
+        'is done; `ndjson` prints each artist or recording on its own line as ' + \
+        'soon as it has been scraped. Defaults to json.')
+    scrape.add_argument('--pack', action='store_true', help=
+        'Save metadata into a pack of a few large files in the destination directory, ' + \
+        'rather than a JSON file apiece. Scraping into an existing pack adds to it. ' + \
+        'See `unpack`.')
+    add_json_arguments(scrape)
+    add_cache_arguments(scrape)
     add_recordings_argument(scrape, 'scrape')
 
     download = subparsers.add_parser('download', epilog=EPILOG,
@@ -101,6 +192,10 @@ def make_arg_parser():
         'Tag the downloaded recording(s).')
     download.add_argument('-a', '--art', action='store_true', help=
         'Download album art, if available, and embed it in the recording(s).')
+    download.add_argument('--tag-first', action='store_true', help=
+        'With -t/--tag, write the tag first and download the audio after it, so ' + \
+        'that each file is written only once. Album art is then fetched before, ' + \
+        'rather than during, each download.')
     download.add_argument('-p', '--print', action='store_true', help=
         'Print JSON data for the recording(s); same as the `scrape` action.')
     download.add_argument('-j', '--save-json', action='store_true', help=
@@ -108,11 +203,88 @@ def make_arg_parser():
     download.add_argument('-r', '--artist-dirs', action='store_true', help=
         'For each artist ID specified, save all of the artists\' recordings ' + \
         'in artist-specific directories.')
-    add_recordings_argument(download, 'download')
+    download.add_argument('--transfers', type=int, default=config.DEFAULT_MAX_PROCESSES,
+        metavar='N', help=
+        'The maximum number of recordings to download (i.e. rtmpdump processes to ' + \
+        'run) at once, independently of -m. ' + \
+        f'Defaults to {config.DEFAULT_MAX_PROCESSES}.')
+    download.add_argument('--stall-timeout', type=float, default=config.DEFAULT_STALL_TIMEOUT,
+        metavar='SECONDS', help=
+        'Kill and retry a download that has made no progress for this long. ' + \
+        f'Defaults to {config.DEFAULT_STALL_TIMEOUT}.')
+    download.add_argument('--tag-workers', type=int, default=DEFAULT_TAG_WORKERS,
+        metavar='N', help=
+        'The number of recordings to tag at once. ' + \
+        f'Defaults to {DEFAULT_TAG_WORKERS}.')
+    add_json_arguments(download)
+    add_cache_arguments(download)
+    download.add_argument('--retry-failed', action='store_true', help=
+        'Instead of downloading the given recordings, retry those that failed in ' + \
+        'earlier runs with the same destination.')
+    add_recordings_argument(download, 'download', nargs='*')
     download.register('action', 'disclaimer', DisclaimerAction)
     download.add_argument('--disclaimer', nargs=0, action='disclaimer', help=
         'Show the disclaimer displayed when download mode is first used.')
 
+    index = subparsers.add_parser('index',
+        help='Build a local catalog of recording metadata for `search`.')
+    index_subparsers = index.add_subparsers(dest='index_action', metavar='index_action',
+                                            required=True)
+    index_build = index_subparsers.add_parser('build', epilog=EPILOG,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        help='Scrape recordings and artists and add them to the catalog.')
+    add_db_argument(index_build)
+    add_cache_arguments(index_build)
+    add_recordings_argument(index_build, 'add to the catalog')
+
+    sync = subparsers.add_parser('sync',
+        help='Bring the catalog up to date with loc.gov, printing what changed as NDJSON.')
+    add_db_argument(sync)
+    add_cache_arguments(sync)
+    sync.add_argument('--verify', type=int, default=DEFAULT_SYNC_VERIFY, metavar='N', help=
+        'The number of previously-synced records of each type to re-check for edits ' + \
+        f'and removals, least recently checked first. Defaults to {DEFAULT_SYNC_VERIFY}.')
+
+    sweep = subparsers.add_parser('sweep',
+        help='Check which recording and artist IDs exist, so that ranges and ' + \
+             'random selections can skip the ones that do not.')
+    sweep.add_argument('--recheck', action='store_true', help=
+        'Check every ID, not just those that have not been checked before.')
+
+    unpack = subparsers.add_parser('unpack',
+        help='Save the metadata in a pack made by `scrape --pack` as individual JSON files.')
+    unpack.add_argument('-r', '--artist-dirs', action='store_true', help=
+        'Save artist information as a directory containing individual JSON files ' + \
+        'for each recording, rather than the default of a single JSON file.')
+    unpack.add_argument('-d', '--dest', type=str, default='.', help=
+        'Destination directory for the JSON files.')
+    add_json_arguments(unpack)
+    unpack.add_argument('pack', nargs='?', default='.', help=
+        'The directory containing the pack. Defaults to the current directory.')
+
+    search = subparsers.add_parser('search',
+        help='Search the local catalog built by `index build`.')
+    add_db_argument(search)
+    search.add_argument('-a', '--artist', help=
+        'Only match recordings crediting an artist whose name contains ARTIST.')
+    search.add_argument('-r', '--role', help=
+        'Only match recordings crediting an artist in a role containing ROLE, ' + \
+        'e.g. `Composer`. With -a/--artist, both must match the same credit.')
+    search.add_argument('-l', '--language', help=
+        'Only match recordings whose language contains LANGUAGE.')
+    search.add_argument('-g', '--genre', help=
+        'Only match recordings with a genre containing GENRE.')
+    search.add_argument('-y', '--years', help=
+        'Only match recordings made in the given year (`1925`), inclusive range ' + \
+        'of years (`1920-1925`) or decade (`1920s`).')
+    search.add_argument('-n', '--limit', type=int, help=
+        'The maximum number of results to show.')
+    search.add_argument('-f', '--format', choices=['table', 'ids', 'json'], default='table', help=
+        'Output format. `ids` prints matching IDs on a single line, e.g. for ' + \
+        '`locdown download $(locdown search -f ids ...)`. Defaults to table.')
+    search.add_argument('query', nargs='*', default=[], help=
+        'Words to match in titles and notes (SQLite FTS5 query syntax).')
+
     return root
 
 def parse_args(argv):
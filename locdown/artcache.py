@@ -0,0 +1,107 @@
+import hashlib, os, pathlib
+
+from . import config
+from .memo import Memo
+from .resilience import TransientError
+from .session import OVERLOAD_STATUSES
+
+ART_DIR = config.USER_DATA_DIR.joinpath('cache', 'art')
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024 # In bytes
+DEFAULT_MEMORY_ENTRIES = 256
+EVICTION_LOW_WATER = 0.9 # Evict down to this fraction of max_size
+
+# A cache of album art. Many recordings share the same label image, so images
+# are stored by the hash of their contents in `blobs`, and each URL maps to a
+# hash through a small file in `urls` named by the hash of the URL. As with the
+# page cache, a blob's mtime is bumped whenever it is read, and the least
+# recently used blobs are evicted once the cache exceeds `max_size`.
+#
+# Recently used images are also kept in memory, and concurrent requests for
+# the same URL share a single fetch. With no `path`, only the memory cache is
+# used.
+class ArtCache:
+  def __init__(self, path=ART_DIR, max_size=DEFAULT_MAX_SIZE,
+               memory_entries=DEFAULT_MEMORY_ENTRIES):
+    self.path = pathlib.Path(path) if path else None
+    self.max_size = max_size
+    self.memo = Memo(memory_entries)
+    if self.path:
+      self.blobs_path = self.path.joinpath('blobs')
+      self.urls_path = self.path.joinpath('urls')
+      self.blobs_path.mkdir(parents=True, exist_ok=True)
+      self.urls_path.mkdir(parents=True, exist_ok=True)
+      self.size = sum(p.stat().st_size for p in self.blobs_path.iterdir())
+
+  def _url_path(self, url):
+    return self.urls_path.joinpath(hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+  # Returns the image at `url`, or None if loc.gov doesn't have it
+  async def get(self, session, url):
+    return await self.memo(url, self._get, session, url)
+
+  async def _get(self, session, url):
+    data = self._read(url) if self.path else None
+    if data is not None:
+      return data
+
+    async with session.get(url) as response:
+      if response.status in OVERLOAD_STATUSES:
+        raise TransientError(f'{url} returned HTTP {response.status}')
+      if response.status != 200:
+        return None
+      data = await response.read()
+
+    if self.path:
+      self._write(url, data)
+    return data
+
+  def _read(self, url):
+    try:
+      blob_path = self.blobs_path.joinpath(self._url_path(url).read_text())
+      data = blob_path.read_bytes()
+      os.utime(blob_path)
+    except OSError:
+      return None
+    return data
+
+  def _write(self, url, data):
+    hash_ = hashlib.sha256(data).hexdigest()
+    blob_path = self.blobs_path.joinpath(hash_)
+    if not blob_path.is_file():
+      tmp_path = blob_path.with_suffix('.tmp')
+      tmp_path.write_bytes(data)
+      os.replace(tmp_path, blob_path)
+      self.size += len(data)
+    self._url_path(url).write_text(hash_)
+
+    if self.size > self.max_size:
+      self.evict()
+
+  def evict(self):
+    entries = []
+    for p in self.blobs_path.iterdir():
+      try:
+        stat = p.stat()
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, p))
+    entries.sort()
+
+    self.size = sum(size for _, size, _ in entries)
+    target = self.max_size * EVICTION_LOW_WATER
+    for _, size, p in entries:
+      if self.size <= target:
+        break
+      try:
+        p.unlink()
+      except OSError:
+        continue
+      self.size -= size
+
+    # Drop URLs whose images were evicted
+    for p in self.urls_path.iterdir():
+      try:
+        if not self.blobs_path.joinpath(p.read_text()).is_file():
+          p.unlink()
+      except OSError:
+        continue
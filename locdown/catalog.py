@@ -0,0 +1,264 @@
+import json, re, time
+
+from . import config, util
+from .jukebox.models import Ref, to_json
+
+DEFAULT_PATH = config.CATALOG_PATH
+COMMIT_INTERVAL = 100 # Number of records written between commits
+YEAR_REGEX = re.compile(r'(\d{4})')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS recordings (
+  id INTEGER PRIMARY KEY,
+  title TEXT,
+  date TEXT,
+  year INTEGER,
+  language TEXT,
+  category TEXT,
+  label TEXT,
+  place TEXT,
+  notes TEXT,
+  metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS recordings_year ON recordings (year);
+CREATE INDEX IF NOT EXISTS recordings_language ON recordings (language);
+
+CREATE TABLE IF NOT EXISTS artists (
+  id INTEGER PRIMARY KEY,
+  name TEXT,
+  alias TEXT,
+  description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS roles (
+  id INTEGER PRIMARY KEY,
+  name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS credits (
+  recording_id INTEGER NOT NULL REFERENCES recordings (id),
+  artist_id INTEGER NOT NULL REFERENCES artists (id),
+  role_id INTEGER NOT NULL REFERENCES roles (id),
+  alias TEXT,
+  PRIMARY KEY (recording_id, role_id, artist_id)
+);
+CREATE INDEX IF NOT EXISTS credits_artist ON credits (artist_id);
+
+CREATE TABLE IF NOT EXISTS genres (
+  id INTEGER PRIMARY KEY,
+  name TEXT UNIQUE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS recording_genres (
+  recording_id INTEGER NOT NULL REFERENCES recordings (id),
+  genre_id INTEGER NOT NULL REFERENCES genres (id),
+  PRIMARY KEY (recording_id, genre_id)
+);
+
+CREATE TABLE IF NOT EXISTS related_takes (
+  recording_id INTEGER NOT NULL REFERENCES recordings (id),
+  related_id INTEGER NOT NULL,
+  PRIMARY KEY (recording_id, related_id)
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS recordings_fts USING fts5 (
+  title, other_titles, notes
+);
+
+CREATE TABLE IF NOT EXISTS sync_records (
+  type TEXT NOT NULL,
+  id INTEGER NOT NULL,
+  hash TEXT NOT NULL,
+  checked REAL NOT NULL,
+  PRIMARY KEY (type, id)
+);
+CREATE INDEX IF NOT EXISTS sync_records_checked ON sync_records (type, checked);
+
+CREATE TABLE IF NOT EXISTS sync_progress (
+  type TEXT PRIMARY KEY,
+  max_id INTEGER NOT NULL
+);
+'''
+
+# The ID at the end of a details page link
+def _link_id(link):
+  return int(link.rstrip('/').split('/')[-1])
+
+def _as_list(value):
+  if value is None:
+    return []
+  return value if type(value) is list else [ value ]
+
+def _alias_name(ref):
+  alias = ref.alias
+  return alias if type(alias) == str or alias is None else alias.name
+
+# A normalized SQLite index of scraped metadata. Each recording's full
+# metadata is also kept as JSON, so results can be printed exactly as `scrape`
+# would print them.
+class Catalog:
+  def __init__(self, path=DEFAULT_PATH):
+    import sqlite3 # Only needed by the actions that use the catalog
+    self.db = sqlite3.connect(str(path))
+    self.db.executescript(SCHEMA)
+    self.num_pending = 0
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    self.db.commit()
+    self.db.close()
+
+  def _written(self):
+    self.num_pending += 1
+    if self.num_pending >= COMMIT_INTERVAL:
+      self.db.commit()
+      self.num_pending = 0
+
+  def _name_id(self, table, name):
+    self.db.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (name,))
+    return self.db.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()[0]
+
+  def add_artist(self, md):
+    self.db.execute('''
+        INSERT INTO artists (id, name, alias, description) VALUES (?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+          name = excluded.name, alias = excluded.alias, description = excluded.description
+        ''', (md.id, md.name, _alias_name(md), md.description))
+    for rmd in md.recordings or []:
+      if rmd.artists is not None: # Shallow entries don't have enough data to index
+        self.add_recording(rmd)
+    self._written()
+
+  def remove_recording(self, id_):
+    for table in [ 'credits', 'recording_genres', 'related_takes' ]:
+      self.db.execute(f'DELETE FROM {table} WHERE recording_id = ?', (id_,))
+    self.db.execute('DELETE FROM recordings_fts WHERE rowid = ?', (id_,))
+    self.db.execute('DELETE FROM recordings WHERE id = ?', (id_,))
+
+  def remove_artist(self, id_):
+    self.db.execute('DELETE FROM artists WHERE id = ?', (id_,))
+
+  def add_recording(self, md):
+    id_ = md.id
+    self.remove_recording(id_)
+
+    date = md.date
+    year = YEAR_REGEX.search(date) if date else None
+    self.db.execute('''
+        INSERT INTO recordings
+          (id, title, date, year, language, category, label, place, notes, metadata)
+          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (id_, md.title, date, int(year.group(1)) if year else None,
+              md.language, md.category, md.label, md.place, md.notes,
+              json.dumps(md, sort_keys=True, ensure_ascii=False, default=to_json)))
+
+    other_titles = util.flatten(list((md.other_titles or {}).values()))
+    self.db.execute('''
+        INSERT INTO recordings_fts (rowid, title, other_titles, notes) VALUES (?, ?, ?, ?)
+        ''', (id_, md.title, '\n'.join(other_titles), md.notes))
+
+    for role, refs in (md.artists or {}).items():
+      role_id = self._name_id('roles', role)
+      for ref in refs:
+        artist_id = _link_id(ref.link)
+        self.db.execute('INSERT OR IGNORE INTO artists (id, name) VALUES (?, ?)',
+                        (artist_id, ref.name))
+        self.db.execute('''
+            INSERT OR IGNORE INTO credits (recording_id, artist_id, role_id, alias)
+              VALUES (?, ?, ?, ?)
+            ''', (id_, artist_id, role_id, _alias_name(ref)))
+
+    for genre in _as_list(md.genres):
+      self.db.execute('INSERT OR IGNORE INTO recording_genres VALUES (?, ?)',
+                      (id_, self._name_id('genres', genre)))
+
+    for take in _as_list(md.related_takes):
+      if isinstance(take, Ref):
+        self.db.execute('INSERT OR IGNORE INTO related_takes VALUES (?, ?)',
+                        (id_, _link_id(take.link)))
+
+    self._written()
+
+  # All filters are optional and combined with AND. `text` is an FTS5 query
+  # over titles and notes; `artist`, `role`, `language` and `genre` match
+  # case-insensitive substrings; `years` is an inclusive (first, last) pair.
+  # When both `artist` and `role` are given, they must match the same credit.
+  def search(self, text=None, artist=None, role=None, language=None, genre=None,
+             years=None, limit=None):
+    clauses, params = [], []
+
+    if text:
+      clauses.append('id IN (SELECT rowid FROM recordings_fts WHERE recordings_fts MATCH ?)')
+      params.append(text)
+
+    if artist or role:
+      credit_clauses = []
+      if artist:
+        credit_clauses.append('(a.name LIKE ? OR a.alias LIKE ? OR c.alias LIKE ?)')
+        params += 3 * [ f'%{artist}%' ]
+      if role:
+        credit_clauses.append('ro.name LIKE ?')
+        params.append(f'%{role}%')
+      clauses.append('''id IN (
+          SELECT c.recording_id FROM credits c
+            JOIN artists a ON a.id = c.artist_id
+            JOIN roles ro ON ro.id = c.role_id
+            WHERE ''' + ' AND '.join(credit_clauses) + ')')
+
+    if language:
+      clauses.append('language LIKE ?')
+      params.append(f'%{language}%')
+
+    if genre:
+      clauses.append('''id IN (
+          SELECT rg.recording_id FROM recording_genres rg
+            JOIN genres g ON g.id = rg.genre_id
+            WHERE g.name LIKE ?)''')
+      params.append(f'%{genre}%')
+
+    if years:
+      clauses.append('year BETWEEN ? AND ?')
+      params += list(years)
+
+    query = 'SELECT id, date, title, metadata FROM recordings'
+    if clauses:
+      query += ' WHERE ' + ' AND '.join(clauses)
+    query += ' ORDER BY id'
+    if limit:
+      query += ' LIMIT ?'
+      params.append(limit)
+
+    return self.db.execute(query, params).fetchall()
+
+  # Bookkeeping for `locdown sync`. `type_` is an IDType value. Each synced
+  # record has a hash of its metadata and the time it was last checked.
+
+  def sync_hash(self, type_, id_):
+    row = self.db.execute('SELECT hash FROM sync_records WHERE type = ? AND id = ?',
+                          (type_, id_)).fetchone()
+    return row[0] if row else None
+
+  def set_sync_hash(self, type_, id_, hash_):
+    self.db.execute('INSERT OR REPLACE INTO sync_records VALUES (?, ?, ?, ?)',
+                    (type_, id_, hash_, time.time()))
+
+  def remove_sync_record(self, type_, id_):
+    self.db.execute('DELETE FROM sync_records WHERE type = ? AND id = ?', (type_, id_))
+
+  def least_recently_checked(self, type_, count):
+    return [ id_ for id_, in self.db.execute('''
+        SELECT id FROM sync_records WHERE type = ? ORDER BY checked LIMIT ?
+        ''', (type_, count)) ]
+
+  def synced_max_id(self, type_):
+    row = self.db.execute('SELECT max_id FROM sync_progress WHERE type = ?',
+                          (type_,)).fetchone()
+    return row[0] if row else 0
+
+  def set_synced_max_id(self, type_, max_id):
+    self.db.execute('INSERT OR REPLACE INTO sync_progress VALUES (?, ?)', (type_, max_id))
@@ -0,0 +1,172 @@
+from collections import deque
+import asyncio, contextlib, contextvars, itertools, math, time
+
+DEFAULT_INITIAL = 4
+DEFAULT_MINIMUM = 1
+DEFAULT_MAXIMUM = 64
+DECREASE_FACTOR = 0.5 # Applied on timeouts, 429s and 5xx errors
+SLOW_DECREASE_FACTOR = 0.8 # Applied when latency degrades without errors
+LATENCY_TOLERANCE = 3 # Multiple of the baseline latency considered healthy
+BASELINE_DECAY = 1.01 # Lets the baseline latency creep up over time
+HISTORY_LENGTH = 32
+
+# A concurrency limit that adapts to how the server is coping, using additive
+# increase/multiplicative decrease (AIMD). It doesn't hold requests back
+# itself; a Scheduler (below) does, following its current limit. Each request
+# made under it should report its outcome. While requests succeed with healthy
+# latency, the limit grows by roughly one per `limit` successes; on errors, or
+# when latency climbs well above the best recently observed, it is cut
+# multiplicatively. Only one cut is made per round trip: outcomes of requests
+# started before the last cut reflect the old limit and are ignored.
+class AdaptiveLimiter:
+  def __init__(self, initial=DEFAULT_INITIAL, minimum=DEFAULT_MINIMUM, maximum=DEFAULT_MAXIMUM):
+    self.minimum = minimum
+    self.maximum = maximum
+    self._limit = float(initial)
+    self.baseline = None
+    self.last_decrease = 0
+    self.history = deque([ self.limit ], maxlen=HISTORY_LENGTH)
+    self.listeners = [] # Called whenever the limit changes
+
+  @property
+  def limit(self):
+    return math.floor(self._limit)
+
+  def _set_limit(self, value):
+    old = self.limit
+    self._limit = min(max(value, self.minimum), self.maximum)
+    if self.limit != old:
+      self.history.append(self.limit)
+      for listener in self.listeners:
+        listener()
+
+  # `started` is the time.monotonic() at which the request was made
+  def report(self, started, ok):
+    now = time.monotonic()
+    latency = now - started
+
+    if ok:
+      self.baseline = latency if self.baseline is None \
+          else min(latency, self.baseline * BASELINE_DECAY)
+      if latency <= self.baseline * LATENCY_TOLERANCE:
+        self._set_limit(self._limit + 1 / self._limit)
+        return
+
+    if started < self.last_decrease:
+      return
+    self.last_decrease = now
+    self._set_limit(self._limit * (DECREASE_FACTOR if not ok else SLOW_DECREASE_FACTOR))
+
+# The group (see Scheduler) of whatever the current task is working on
+_group = contextvars.ContextVar('group', default=None)
+
+# Makes whatever runs in the block, and any tasks it starts, a group of its own
+@contextlib.contextmanager
+def new_group():
+  token = _group.set(object())
+  try:
+    yield
+  finally:
+    _group.reset(token)
+
+# Shares `limit` slots (a number, or an AdaptiveLimiter's current limit)
+# between every operation that acquires one, however deeply nested, so that
+# a limit means the same thing whether it's spent on one item's fan-out or on
+# many items. Operations belong to the group of the task they are run in (see
+# `new_group`); as slots free up, they go to the waiting group with the fewest
+# in flight, and among those to the one that has waited longest, so every
+# group gets a fair share however many operations each has queued. Within a
+# group, waiters are served in FIFO order.
+class Scheduler:
+  def __init__(self, limit):
+    self.limiter = limit if isinstance(limit, AdaptiveLimiter) else None
+    self._limit = limit
+    self.in_flight = 0
+    self.group_in_flight = {}
+    self.waiters = {} # group -> deque of (sequence number, future)
+    self.num_waiting = 0
+    self._sequence = itertools.count()
+    if self.limiter:
+      self.limiter.listeners.append(self._wake)
+
+  @property
+  def limit(self):
+    return self.limiter.limit if self.limiter else self._limit
+
+  def _grant(self, group):
+    self.in_flight += 1
+    self.group_in_flight[group] = self.group_in_flight.get(group, 0) + 1
+
+  def _dequeue(self, group, entry):
+    queue = self.waiters[group]
+    queue.remove(entry)
+    if not queue:
+      del self.waiters[group]
+    self.num_waiting -= 1
+
+  def _wake(self):
+    while self.waiters and self.in_flight < self.limit:
+      group = min(self.waiters,
+                  key=lambda group: (self.group_in_flight.get(group, 0), self.waiters[group][0][0]))
+      entry = self.waiters[group][0]
+      self._dequeue(group, entry)
+      if not entry[1].done(): # Waiters cancelled while queued are skipped
+        self._grant(group)
+        entry[1].set_result(None)
+
+  async def acquire(self):
+    group = _group.get()
+    if not self.num_waiting and self.in_flight < self.limit:
+      self._grant(group)
+      return
+
+    waiter = asyncio.get_running_loop().create_future()
+    entry = (next(self._sequence), waiter)
+    self.waiters.setdefault(group, deque()).append(entry)
+    self.num_waiting += 1
+    try:
+      await waiter
+    except asyncio.CancelledError:
+      if waiter.done() and not waiter.cancelled():
+        self.release() # Granted a slot, but cancelled before it could be used
+      elif entry in self.waiters.get(group, ()):
+        self._dequeue(group, entry)
+      raise
+
+  # Must be called from the same task (or at least group) as `acquire`
+  def release(self):
+    group = _group.get()
+    self.in_flight -= 1
+    self.group_in_flight[group] -= 1
+    if not self.group_in_flight[group]:
+      del self.group_in_flight[group]
+    self._wake()
+
+  async def __aenter__(self):
+    await self.acquire()
+    return self
+
+  async def __aexit__(self, *exc):
+    self.release()
+
+# Limits the rate at which operations start to `rate` per second on average,
+# while allowing up to `burst` of them back-to-back after an idle period.
+# Waiters are served in FIFO order.
+class TokenBucket:
+  def __init__(self, rate, burst=1):
+    self.rate = rate
+    self.capacity = max(burst, 1)
+    self.tokens = self.capacity
+    self.updated = time.monotonic()
+    self._lock = asyncio.Lock()
+
+  async def acquire(self):
+    async with self._lock:
+      while True:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        await asyncio.sleep((1 - self.tokens) / self.rate)
@@ -3,3 +3,22 @@ import pathlib
 import appdirs
 
 USER_DATA_DIR = pathlib.Path(appdirs.user_data_dir("locdown", "SpencerMichaels"))
+
+# Sent with every request. A fixed, current browser string; looking one up at
+# launch (e.g. with fake_useragent) costs more than the rest of startup.
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 ' + \
+             '(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36'
+
+# Defaults of command-line options, kept here rather than in the modules that
+# use them so that parsing arguments doesn't import those modules
+CATALOG_PATH = USER_DATA_DIR.joinpath('catalog.sqlite')
+DEFAULT_CACHE_TTL = 7 * 24 * 60 * 60 # One week, in seconds
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1 # In seconds; doubled on each subsequent retry
+DEFAULT_MAX_PROCESSES = 8 # rtmpdump processes run at once
+DEFAULT_STALL_TIMEOUT = 60 # In seconds
+
+FSYNC_NEVER = 'never'
+FSYNC_BATCH = 'batch'
+FSYNC_ALWAYS = 'always'
+FSYNC_POLICIES = [ FSYNC_NEVER, FSYNC_BATCH, FSYNC_ALWAYS ]
@@ -1,6 +1,6 @@
 from collections import namedtuple
 from enum import Enum
-import functools, pathlib, random, re, time
+import itertools, pathlib, random, re, time
 
 from . import config, util
 from . import jukebox
@@ -8,12 +8,18 @@ from . import jukebox
 ID = namedtuple('ID', 'value type_')
 IDRange = namedtuple('IDRange', 'start end type_')
 IDRandom = namedtuple('IDRandom', 'count type_')
+IDExclusion = namedtuple('IDExclusion', 'spec type_')
+IDIntersection = namedtuple('IDIntersection', 'specs type_')
+# An IDRandom once its IDs have been chosen. `ids` is a dict (with no values),
+# which keeps them in order and can be checked for membership quickly.
+IDSample = namedtuple('IDSample', 'ids type_')
 
 class IDType(Enum):
   RECORDING = 'recording'
   ARTIST = 'artist'
 
 MAX_ID_UPDATE_INTERVAL = 24 * 60 * 60 # One day, in seconds
+MAX_ID_PROBE_WIDTH = jukebox.DEFAULT_PROBE_WIDTH # IDs checked at once while enumerating
 MAX_ID_VALUES = { # Accurate as of August 26, 2019
     IDType.RECORDING: 10330,
     IDType.ARTIST: 6542
@@ -43,7 +49,7 @@ async def update_max_id(type_, session):
   saved_value = get_max_id(type_)
   new_value = await jukebox.find_max_valid_id(
       session, type_.value + 's',
-      saved_value or MAX_ID_VALUES[type_])
+      saved_value or MAX_ID_VALUES[type_], width=MAX_ID_PROBE_WIDTH)
 
   path = get_max_id_path(type_)
   if new_value != saved_value:
@@ -53,23 +59,170 @@ async def update_max_id(type_, session):
     path.touch()
   return new_value
 
+# Every spec nested in `spec`, and `spec` itself
+def _walk(spec):
+  yield spec
+  if type(spec) is IDExclusion:
+    yield from _walk(spec.spec)
+  elif type(spec) is IDIntersection:
+    for part in spec.specs:
+      yield from _walk(part)
+
+# A function that checks whether an ID is in `spec`
+def _membership(spec):
+  if type(spec) is ID:
+    return lambda value: value == spec.value
+  elif type(spec) is IDRange:
+    start, end = spec.start, spec.end
+    return lambda value: start <= value <= end
+  elif type(spec) is IDSample:
+    return spec.ids.__contains__
+  elif type(spec) is IDExclusion:
+    contains = _membership(spec.spec)
+    return lambda value: not contains(value)
+  elif type(spec) is IDIntersection:
+    parts = list(map(_membership, spec.specs))
+    return lambda value: all(contains(value) for contains in parts)
+
+# Sets of IDs are kept as sorted lists of disjoint, non-adjacent (first, last)
+# intervals, so that they take time and memory in proportion to the number of
+# specs rather than the number of IDs.
+
+def _union(intervals):
+  merged = []
+  for first, last in sorted(intervals):
+    if merged and first <= merged[-1][1] + 1:
+      if last > merged[-1][1]:
+        merged[-1] = (merged[-1][0], last)
+    else:
+      merged.append((first, last))
+  return merged
+
+def _intersect(a, b):
+  result, i, j = [], 0, 0
+  while i < len(a) and j < len(b):
+    first, last = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+    if first <= last:
+      result.append((first, last))
+    if a[i][1] < b[j][1]:
+      i += 1
+    else:
+      j += 1
+  return result
+
+def _subtract(a, b):
+  result, j = [], 0
+  for first, last in a:
+    while j < len(b) and b[j][1] < first:
+      j += 1
+    k = j
+    while k < len(b) and b[k][0] <= last:
+      if b[k][0] > first:
+        result.append((first, b[k][0] - 1))
+      first = max(first, b[k][1] + 1)
+      k += 1
+    if first <= last:
+      result.append((first, last))
+  return result
+
+# The IDs in `spec` (other than an exclusion), as intervals
+def _intervals(spec):
+  if type(spec) is ID:
+    return [ (spec.value, spec.value) ]
+  elif type(spec) is IDRange:
+    return [ (spec.start, spec.end) ] if spec.start <= spec.end else []
+  elif type(spec) is IDSample:
+    return _union((value, value) for value in spec.ids)
+  elif type(spec) is IDIntersection:
+    included = [ part for part in spec.specs if type(part) is not IDExclusion ]
+    if not included:
+      raise ValueError('An intersection must include at least one set of IDs that is not excluded.')
+    intervals = _intervals(included[0])
+    for part in included[1:]:
+      intervals = _intersect(intervals, _intervals(part))
+    excluded = [ _intervals(part.spec) for part in spec.specs if type(part) is IDExclusion ]
+    return _subtract(intervals, _union(itertools.chain(*excluded)))
+
+# The stream of IDs selected by some specs: those in any of the specs other
+# than exclusions, minus those in any exclusion, each produced once. IDs come
+# in ascending order, grouped by type in the order the types first appear.
+#
+# The specs are merged into intervals (see above) up front, so iterating takes
+# time linear in the number of IDs and no more memory than the specs
+# themselves, however large the ranges are; it can be done any number of
+# times, and `len()` and `count()` are worked out from the intervals.
+#
+# `invalid_ids(type_)`, if given, returns the sorted IDs of a type known not
+# to exist, which are skipped unless they were given on their own.
+class IDStream:
+  def __init__(self, specs, invalid_ids=None):
+    self.intervals = {}
+    for type_ in dict.fromkeys(spec.type_ for spec in specs):
+      of_type = [ spec for spec in specs if spec.type_ == type_ ]
+      given = _union(itertools.chain(*(_intervals(spec) for spec in of_type
+                                       if type(spec) is ID)))
+      others = _union(itertools.chain(*(_intervals(spec) for spec in of_type
+                                        if not type(spec) in (ID, IDExclusion))))
+      if invalid_ids:
+        others = _subtract(others, [ (id_, id_) for id_ in invalid_ids(type_) ])
+      excluded = _union(itertools.chain(*(_intervals(spec.spec) for spec in of_type
+                                          if type(spec) is IDExclusion)))
+      self.intervals[type_] = _subtract(_union(given + others), excluded)
+
+  def __iter__(self):
+    for type_ in self.intervals:
+      for value in self.of_type(type_):
+        yield ID(value, type_)
+
+  def __len__(self):
+    return sum(map(self.count, self.intervals))
+
+  def count(self, type_):
+    return sum(last - first + 1 for first, last in self.intervals.get(type_, []))
+
+  def of_type(self, type_):
+    return itertools.chain.from_iterable(
+        range(first, last + 1) for first, last in self.intervals.get(type_, []))
+
 async def expand_ids(session, ids):
-  types = { id_.type_ for id_ in ids }
-  types_needing_upper_bound = { id_.type_ for id_ in ids if type(id_) in [IDRandom] }
+  types_needing_upper_bound = { spec.type_ for id_ in ids for spec in _walk(id_)
+                                if type(spec) is IDRandom }
 
-  for type_ in types:
+  for type_ in types_needing_upper_bound:
     MAX_ID_VALUES[type_] = await update_max_id(type_, session) \
-        if type_ in types_needing_upper_bound and max_id_needs_update(type_) \
-        else get_max_id(type_)
-
-  expand_ids_to_type = lambda type_, ids: map(lambda id_: ID(id_, type_), ids)
-  converters = {
-    ID:        lambda arg: [arg],
-    IDRange:   lambda arg: expand_ids_to_type( \
-        arg.type_, range(arg.start, arg.end+1)),
-    IDRandom:  lambda arg: expand_ids_to_type( \
-        arg.type_, random.sample(range(1, 1 + MAX_ID_VALUES[type_]), arg.count)),
-  }
-
-  return functools.reduce(lambda expanded_ids, arg: \
-      expanded_ids + list(converters[type(arg)](arg)), ids, [])
+        if max_id_needs_update(type_) else get_max_id(type_)
+
+  # Ranges and random selections skip IDs known not to exist
+  id_map = session.id_map
+  invalid_ids = (lambda type_: id_map.invalid_ids(type_.value + 's')) if id_map else None
+
+  # Random selections are made once, up front, so that iterating over the
+  # stream always gives the same IDs. Within an intersection, they are made
+  # from the IDs the other parts allow, so that e.g. `1-5000&random100` gives
+  # 100 IDs from 1-5000 (or as many as there are, if fewer).
+  def sample(spec, allowed=None):
+    max_id = MAX_ID_VALUES[spec.type_]
+    candidates = id_map.candidates(spec.type_.value + 's', 1, max_id) if id_map \
+        else range(1, max_id+1)
+    count = spec.count
+    if allowed:
+      candidates = list(filter(allowed, candidates))
+      count = min(count, len(candidates))
+    return IDSample(dict.fromkeys(random.sample(candidates, count)), spec.type_)
+
+  def resolve(spec):
+    if type(spec) is IDRandom:
+      return sample(spec)
+    elif type(spec) is IDExclusion:
+      return IDExclusion(resolve(spec.spec), spec.type_)
+    elif type(spec) is IDIntersection:
+      parts = [ part if type(part) is IDRandom else resolve(part) for part in spec.specs ]
+      for i, part in enumerate(parts):
+        if type(part) is IDRandom:
+          others = [ _membership(other) for other in parts[:i] + parts[i+1:]
+                     if type(other) is not IDRandom ]
+          parts[i] = sample(part, lambda value: all(contains(value) for contains in others))
+      return IDIntersection(tuple(parts), spec.type_)
+    return spec
+
+  return IDStream(list(map(resolve, ids)), invalid_ids)
@@ -0,0 +1,102 @@
+import os, pathlib
+
+from . import config
+
+IDMAP_DIR = config.USER_DATA_DIR
+UNKNOWN, VALID, INVALID = 0, 1, 2
+BITS_PER_ID = 2
+IDS_PER_BYTE = 8 // BITS_PER_ID
+STATE_MASK = (1 << BITS_PER_ID) - 1
+
+# The known state (UNKNOWN, VALID or INVALID) of every ID in one domain, packed
+# four IDs to a byte. The file on disk is just the raw bytes.
+class Bitmap:
+  def __init__(self, path):
+    self.path = pathlib.Path(path)
+    try:
+      self.bits = bytearray(self.path.read_bytes())
+    except OSError:
+      self.bits = bytearray()
+    self.dirty = False
+
+  def __getitem__(self, id_):
+    byte, slot = divmod(id_, IDS_PER_BYTE)
+    if byte >= len(self.bits):
+      return UNKNOWN
+    return (self.bits[byte] >> (slot * BITS_PER_ID)) & STATE_MASK
+
+  def __setitem__(self, id_, state):
+    byte, slot = divmod(id_, IDS_PER_BYTE)
+    if byte >= len(self.bits):
+      self.bits.extend(bytes(byte - len(self.bits) + 1))
+    shift = slot * BITS_PER_ID
+    value = self.bits[byte] & ~(STATE_MASK << shift) | (state << shift)
+    if value != self.bits[byte]:
+      self.bits[byte] = value
+      self.dirty = True
+
+  def save(self):
+    if not self.dirty:
+      return
+    tmp_path = self.path.with_suffix('.tmp')
+    tmp_path.write_bytes(self.bits)
+    os.replace(tmp_path, self.path)
+    self.dirty = False
+
+# Which recording and artist IDs are known to exist, keyed by URL domain (e.g.
+# `recordings`). It is filled in as pages are fetched and probed, so that
+# ranges and random selections can skip IDs that are known not to exist, and
+# such IDs are never requested again.
+#
+# An ID above the highest one published (see `set_max_id`) may just not have
+# been published yet, so it is only known not to exist, whatever it is marked
+# as, once it is at or below that maximum. When the maximum grows, marks made
+# above the old one are forgotten.
+class IDMap:
+  def __init__(self, path=IDMAP_DIR):
+    self.path = pathlib.Path(path)
+    self.bitmaps = {}
+    self.max_ids = {}
+
+  def _bitmap(self, domain):
+    if not domain in self.bitmaps:
+      self.bitmaps[domain] = Bitmap(self.path.joinpath(f'{domain}.idmap'))
+    return self.bitmaps[domain]
+
+  def set_max_id(self, domain, max_id):
+    old_max_id = self.max_ids.get(domain)
+    if old_max_id is not None and max_id > old_max_id:
+      bitmap = self._bitmap(domain)
+      for id_ in range(old_max_id + 1, max_id + 1):
+        if bitmap[id_] == INVALID:
+          bitmap[id_] = UNKNOWN
+    self.max_ids[domain] = max_id
+
+  def state(self, domain, id_):
+    state = self._bitmap(domain)[id_]
+    if state == INVALID and id_ > self.max_ids.get(domain, 0):
+      return UNKNOWN
+    return state
+
+  def is_invalid(self, domain, id_):
+    return self.state(domain, id_) == INVALID
+
+  def mark(self, domain, id_, valid):
+    self._bitmap(domain)[id_] = VALID if valid else INVALID
+
+  # Every ID known to be invalid, in order
+  def invalid_ids(self, domain):
+    bitmap = self._bitmap(domain)
+    end = min(len(bitmap.bits) * IDS_PER_BYTE, self.max_ids.get(domain, 0) + 1)
+    return [ id_ for id_ in range(end) if bitmap[id_] == INVALID ]
+
+  # The IDs in [start, end] that are not known to be invalid
+  def candidates(self, domain, start, end):
+    return [ id_ for id_ in range(start, end+1) if not self.is_invalid(domain, id_) ]
+
+  def save(self):
+    for bitmap in self.bitmaps.values():
+      bitmap.save()
+
+  def close(self):
+    self.save()
@@ -0,0 +1,89 @@
+import json, os, pathlib
+
+JOURNAL_FILENAME = '.locdown-journal'
+
+SCRAPED = 'scraped'
+TRANSFERRING = 'transferring'
+TAGGED = 'tagged'
+DONE = 'done'
+FAILED = 'failed'
+
+# A record of the progress of each recording downloaded to a destination
+# directory, so that an interrupted download can pick up where it left off.
+# Recordings are keyed by ID and the subdirectory they are downloaded to (e.g.
+# an artist's directory), as the same recording may be downloaded to several.
+# The artists expanded into recordings are also recorded, so that their pages
+# don't need to be scraped again.
+#
+# The file is a log of NDJSON entries, appended to (and flushed) as states
+# change, so it survives being interrupted at any point; the last entry for a
+# key wins. It is compacted when opened.
+class Journal:
+  def __init__(self, dest_dir):
+    self.path = pathlib.Path(dest_dir).joinpath(JOURNAL_FILENAME)
+    self.recordings = {}
+    self.artists = {}
+
+    num_lines = 0
+    if self.path.is_file():
+      with self.path.open('r', encoding='utf-8') as f:
+        for line in f:
+          try:
+            self._apply(json.loads(line))
+          except (ValueError, KeyError):
+            continue # e.g. a line cut short by an interruption
+          num_lines += 1
+
+    if num_lines > len(self.recordings) + len(self.artists):
+      self._compact()
+    self.file = self.path.open('a', encoding='utf-8')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    self.file.close()
+
+  def _apply(self, entry):
+    if 'artist' in entry:
+      self.artists[entry['artist']] = (entry['dir'], entry['recordings'])
+    else:
+      self.recordings[(entry['dir'], entry['id'])] = entry['state']
+
+  def _entries(self):
+    for artist, (dir_, recordings) in self.artists.items():
+      yield { 'artist': artist, 'dir': dir_, 'recordings': recordings }
+    for (dir_, id_), state in self.recordings.items():
+      yield { 'id': id_, 'dir': dir_, 'state': state }
+
+  def _compact(self):
+    tmp_path = self.path.with_suffix('.tmp')
+    with tmp_path.open('w', encoding='utf-8') as f:
+      for entry in self._entries():
+        f.write(json.dumps(entry) + '\n')
+    os.replace(tmp_path, self.path)
+
+  def _append(self, entry):
+    self._apply(entry)
+    self.file.write(json.dumps(entry) + '\n')
+    self.file.flush()
+
+  # `dir_` is relative to the destination directory
+  def state(self, dir_, id_):
+    return self.recordings.get((str(dir_), id_))
+
+  def set_state(self, dir_, id_, state):
+    self._append({ 'id': id_, 'dir': str(dir_), 'state': state })
+
+  def failed(self):
+    return [ (dir_, id_) for (dir_, id_), state in self.recordings.items() if state == FAILED ]
+
+  # Returns (dir, recording IDs), or None if the artist hasn't been expanded
+  def artist(self, id_):
+    return self.artists.get(id_)
+
+  def set_artist(self, id_, dir_, recordings):
+    self._append({ 'artist': id_, 'dir': str(dir_), 'recordings': recordings })
@@ -1,3 +1,4 @@
-from . import keys, url
-from .jukebox import download_recording, find_max_valid_id
-from .scraper import scrape_artist, scrape_recording
+from . import backend, keys, url
+from .models import Artist, ArtistRef, Recording, Ref
+from .jukebox import DEFAULT_PROBE_WIDTH, download_recording, find_max_valid_id, id_exists
+from .scraper import parse_pool, scrape_artist, scrape_recording
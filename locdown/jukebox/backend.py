@@ -0,0 +1,126 @@
+import importlib.util
+
+from . import regions as regions_
+
+# HTML parser backends for the scraper. Every backend's `parse` returns a tree
+# supporting the subset of BeautifulSoup's API that the scraper relies on:
+# `find`, `find_all`, `select`, `select_one`, `get_text` and `tag['attr']`.
+
+def is_installed(module):
+  return importlib.util.find_spec(module) is not None
+
+class SoupBackend:
+  def __init__(self, name, module):
+    self.name = name
+    self.module = module
+
+  def available(self):
+    return is_installed(self.module)
+
+  def parse(self, html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, self.name)
+
+# Converts BeautifulSoup-style `find` arguments to a CSS selector. As in bs4, a
+# class value containing spaces (or an empty one) must match the attribute
+# exactly; otherwise it matches any one of the element's classes.
+def _attrs_to_selector(name, attrs=None, class_=None):
+  attrs = dict(attrs or {})
+  if class_ is not None:
+    attrs['class'] = class_
+
+  selector = name or '*'
+  for key, value in attrs.items():
+    op = '~=' if key == 'class' and value and not ' ' in value else '='
+    selector += f'[{key}{op}"{value}"]'
+  return selector
+
+class LexborTag:
+  def __init__(self, node):
+    self.node = node
+
+  def _wrap_all(self, nodes):
+    # Unlike bs4, selectolax includes the node itself in its own matches
+    return [ LexborTag(n) for n in nodes if n.mem_id != self.node.mem_id ]
+
+  def select(self, selector):
+    return self._wrap_all(self.node.css(selector))
+
+  def select_one(self, selector):
+    matches = self.select(selector)
+    return matches[0] if matches else None
+
+  def find_all(self, name=None, attrs=None, class_=None, recursive=True):
+    selector = _attrs_to_selector(name, attrs, class_)
+    if recursive:
+      return self.select(selector)
+    return [ LexborTag(n) for n in self.node.iter() if n.css_matches(selector) ]
+
+  def find(self, name=None, attrs=None, class_=None):
+    return self.select_one(_attrs_to_selector(name, attrs, class_))
+
+  def get_text(self):
+    return self.node.text(deep=True)
+
+  def __getitem__(self, key):
+    return self.node.attributes[key]
+
+  def __str__(self):
+    return self.node.html
+
+class LexborBackend:
+  name = 'selectolax'
+
+  def available(self):
+    return is_installed('selectolax')
+
+  def parse(self, html):
+    from selectolax.lexbor import LexborHTMLParser
+    return LexborTag(LexborHTMLParser(html).root)
+
+BACKENDS = {
+    'lxml': SoupBackend('lxml', 'lxml'),
+    'html5lib': SoupBackend('html5lib', 'html5lib'),
+    'selectolax': LexborBackend(),
+}
+
+# Preference order for `auto`; html5lib is the slowest, but is kept as the
+# fallback since it is guaranteed to produce the same tree as a browser.
+AUTO_ORDER = ['lxml', 'html5lib']
+
+_backend = None
+_partial = True
+
+def set_backend(name):
+  global _backend
+  if name == 'auto':
+    name = next((n for n in AUTO_ORDER if BACKENDS[n].available()), AUTO_ORDER[-1])
+  backend = BACKENDS[name]
+  if not backend.available():
+    raise RuntimeError(f'The {name} parser backend is not installed.')
+  _backend = backend
+
+# When enabled, `parse` is given only the regions the scraper reads; see
+# `regions.extract`.
+def set_partial_parsing(enabled):
+  global _partial
+  _partial = enabled
+
+def get_backend():
+  if not _backend:
+    set_backend('auto')
+  return _backend
+
+# The configuration needed to reproduce this module's settings in a worker
+# process; see `configure`.
+def get_config():
+  return get_backend().name, _partial
+
+def configure(name, partial):
+  set_backend(name)
+  set_partial_parsing(partial)
+
+def parse(html, regions=None):
+  if regions and _partial:
+    html = regions_.extract(html, regions) or html
+  return get_backend().parse(html)
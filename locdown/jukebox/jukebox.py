@@ -1,54 +1,115 @@
-import asyncio
-import urllib
+import asyncio, contextlib
 
 from . import url
+from ..resilience import TransientError
+from ..session import OVERLOAD_STATUSES
+from ..supervisor import Supervisor
 
-async def download_recording(id_, bitrate=320, filepath=None):
+DEFAULT_PROBE_WIDTH = 8 # Concurrent probes per round when searching for the maximum ID
+# Responses to HEAD from servers that only allow GET
+HEAD_UNSUPPORTED_STATUSES = { 405, 501 }
+
+# With `header`, the file at `filepath` is started with it, and rtmpdump's
+# output is written straight after it. rtmpdump is run by `supervisor` (see
+# supervisor.py); its ProcessStats are returned, along with the audio data if
+# there is no `filepath`. With `resume`, an incomplete file at `filepath` is
+# resumed rather than overwritten.
+async def download_recording(id_, bitrate=320, filepath=None, header=None, supervisor=None,
+                             resume=False):
   base_url, playpath = url.id_to_stream_url_parts(id_, bitrate)
+  supervisor = supervisor or Supervisor()
 
   cmd = ['-r', base_url, '-y', playpath]
-  if filepath:
+  if filepath and header is None:
     cmd += ['-o', filepath]
+    if resume:
+      cmd += ['--resume']
+
+  with contextlib.ExitStack() as stack:
+    out = asyncio.subprocess.PIPE if not filepath else asyncio.subprocess.DEVNULL
+    if header is not None:
+      out = stack.enter_context(open(filepath, 'wb'))
+      out.write(header)
+      out.flush()
+
+    return await supervisor.run('rtmpdump', *cmd, stdout=out)
+
+async def _details_status(session, id_, domain):
+  target = url.id_to_details_url(id_, domain)
+  async with session.head(target, allow_redirects=True) as response:
+    status = response.status
+  if status in HEAD_UNSUPPORTED_STATUSES:
+    async with session.get(target) as response:
+      status = response.status
 
-  proc = await asyncio.create_subprocess_exec(
-      'rtmpdump',
-      *cmd,
-      stdout=asyncio.subprocess.PIPE,
-      stderr=asyncio.subprocess.PIPE)
+  if status in OVERLOAD_STATUSES:
+    raise TransientError(f'{target} returned HTTP {status}')
+  return status
 
-  stdout, stderr = await proc.communicate()
+def _mark(session, domain, id_, status):
+  if session.id_map and status in (200, 404):
+    session.id_map.mark(domain, id_, status == 200)
 
-  if proc.returncode != 0:
-    errstr = stderr.decode('utf-8', errors='ignore')
-    raise RuntimeError(f'Rtmpdump failed:\n\n{errstr}')
+# Checks whether a details page exists from its status alone. A HEAD request
+# is used where loc.gov allows it; otherwise the GET is abandoned as soon as
+# the headers arrive, without reading the body. Only a 404 marks the ID as
+# not existing in the session's ID map; other errors may well clear up.
+async def id_exists(session, id_, domain):
+  status = await _details_status(session, id_, domain)
+  _mark(session, domain, id_, status)
+  return status == 200
 
-  if not filepath:
-    return stdout
+# Finds the boundary between valid and invalid IDs near i0, assuming IDs are
+# valid up to some maximum. Each round probes `width` IDs concurrently: first
+# at exponentially growing distances from i0 until the boundary is bracketed,
+# then evenly spaced within the bracket, which shrinks it by a factor of
+# width+1 per round.
+#
+# Probes above the maximum found aren't recorded in the session's ID map, as
+# those IDs may yet be published; the maximum itself is (see IDMap).
+async def find_max_valid_id(session, domain, i0, width=DEFAULT_PROBE_WIDTH):
+  if width < 1:
+    raise ValueError(f'The probe width must be at least 1, not {width}')
 
-async def find_max_valid_id(session, domain, i0):
-  async def is_valid(id_):
-    target = url.id_to_details_url(id_, domain)
-    try:
-      async with session.get(target) as response:
-        return response.status == 200
-    except urllib.error.HTTPError:
-      return False
+  statuses = {}
+  async def probe(ids):
+    ids = sorted(set(ids))
+    results = await asyncio.gather(
+        *(session.retry(_details_status, session, id_, domain) for id_ in ids))
+    statuses.update(zip(ids, results))
+    return [ (id_, status == 200) for id_, status in zip(ids, results) ]
 
-  i0_was_valid = await is_valid(i0)
-  di = 1 if i0_was_valid else -1
-  i = i0 + di
-  while await is_valid(i) == i0_was_valid:
-    i += di
-    di *= 2
+  # max_valid is 0 until a valid ID is found; min_invalid is None until an
+  # invalid one is
+  max_valid, min_invalid = 0, None
+  def narrow(results):
+    nonlocal max_valid, min_invalid
+    for id_, is_valid in results:
+      if not is_valid:
+        min_invalid = id_
+        break
+      max_valid = id_
 
-  max_valid = min(i0, i)
-  min_invalid = max(i0, i)
+  # The first round probes i0 along with the IDs just above it, since the
+  # maximum usually only grows
+  narrow(await probe([i0 + 2**j - 1 for j in range(width)]))
+  step = 2**width
+  while min_invalid is None:
+    narrow(await probe([max_valid + step * 2**j for j in range(width)]))
+    step *= 2**width
+  step = 1
+  while max_valid == 0 and min_invalid > 1:
+    narrow(await probe([max(min_invalid - step * 2**j, 1) for j in range(width)]))
+    step *= 2**width
 
   while max_valid != min_invalid-1:
-    i = max_valid + (min_invalid - max_valid)//2
-    if await is_valid(i):
-      max_valid = i
-    else:
-      min_invalid = i
+    span = min_invalid - max_valid
+    narrow(await probe([max_valid + span*j//(width+1) for j in range(1, width+1)
+                        if 0 < span*j//(width+1) < span]))
 
+  if session.id_map:
+    session.id_map.set_max_id(domain, max_valid)
+    for id_, status in statuses.items():
+      if id_ <= max_valid:
+        _mark(session, domain, id_, status)
   return max_valid
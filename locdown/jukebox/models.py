@@ -0,0 +1,196 @@
+import sys
+
+from . import keys
+
+# Scraped metadata. Each class keeps the fields loc.gov is known to have in
+# slots, rather than in a dict keyed by the long names in keys.py, and any
+# others in `extra`; values that recur across many records (roles, genres,
+# languages, ...) are interned, so the whole catalog shares one copy of each.
+# `to_dict` gives exactly the dict these were scraped as, for JSON output,
+# and `from_dict` reads it back.
+
+def _intern(value):
+  if type(value) is str:
+    return sys.intern(value)
+  elif type(value) is list:
+    return [ _intern(item) for item in value ]
+  return value
+
+# A link to another page, e.g. a related take. `alias` is the name the
+# link's subject is credited under, if it's not their own.
+class Ref:
+  __slots__ = ('link', 'name', 'alias')
+
+  def __init__(self, link=None, name=None, alias=None):
+    self.link = link
+    self.name = name
+    self.alias = alias
+
+  def __eq__(self, other):
+    return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+  def __repr__(self):
+    return f'{type(self).__name__}({self.to_dict()!r})'
+
+  def to_dict(self):
+    d = { keys.REF_LINK: self.link }
+    if self.name is not None:
+      d[keys.REF_NAME] = self.name
+    if self.alias is not None:
+      d[keys.REF_ALIAS] = to_dict(self.alias)
+    return d
+
+  @classmethod
+  def from_dict(cls, d):
+    alias = d.get(keys.REF_ALIAS)
+    return cls(d.get(keys.REF_LINK), d.get(keys.REF_NAME),
+               ArtistRef.from_dict(alias) if type(alias) is dict else alias)
+
+# A credit on a recording. `alias` is either the name the artist is credited
+# under or, where the page lists the artist under both names, another
+# ArtistRef to the artist's page under that name.
+class ArtistRef(Ref):
+  __slots__ = ()
+
+  @staticmethod
+  def is_link(link):
+    return '/artists/' in link
+
+def _is_ref_dict(value):
+  return type(value) is dict and keys.REF_LINK in value and \
+      value.keys() <= { keys.REF_LINK, keys.REF_NAME, keys.REF_ALIAS }
+
+def _from_json(value):
+  if _is_ref_dict(value):
+    return (ArtistRef if ArtistRef.is_link(value[keys.REF_LINK]) else Ref).from_dict(value)
+  elif type(value) is list:
+    return [ _from_json(item) for item in value ]
+  elif type(value) is dict:
+    return { key: _from_json(item) for key, item in value.items() }
+  return value
+
+# The plain form of some metadata, with any models in it converted to dicts
+def to_dict(value):
+  if isinstance(value, (Model, Ref)):
+    return value.to_dict()
+  elif type(value) is list:
+    return [ to_dict(item) for item in value ]
+  elif type(value) is dict:
+    return { key: to_dict(item) for key, item in value.items() }
+  return value
+
+# For json.dumps's `default` (or orjson's)
+def to_json(obj):
+  if isinstance(obj, (Model, Ref)):
+    return obj.to_dict()
+  raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+# Subclasses list their fields in FIELDS as (key, attribute, interned) and
+# have a slot for each attribute, plus `extra`.
+class Model:
+  __slots__ = ()
+  FIELDS = []
+
+  def __init_subclass__(cls):
+    cls.ATTRIBUTES = { key: (attr, interned) for key, attr, interned in cls.FIELDS }
+
+  def __init__(self, **fields):
+    for attr in self.__slots__:
+      setattr(self, attr, fields.get(attr))
+
+  def __eq__(self, other):
+    return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+  def __repr__(self):
+    return f'{type(self).__name__}({self.to_dict()!r})'
+
+  # Sets a field by its key, as named on the page
+  def set(self, key, value):
+    if key in self.ATTRIBUTES:
+      attr, interned = self.ATTRIBUTES[key]
+      setattr(self, attr, _intern(value) if interned else value)
+    else:
+      if self.extra is None:
+        self.extra = {}
+      self.extra[sys.intern(key)] = value
+
+  def to_dict(self):
+    d = {}
+    for key, attr, _ in self.FIELDS:
+      value = getattr(self, attr)
+      if value is not None:
+        d[key] = to_dict(value)
+    if self.extra:
+      d.update(to_dict(self.extra))
+    return d
+
+  # Unpickling (e.g. results from --parse-workers processes) makes new copies
+  # of strings, so fields are set as though scraped to intern them again
+  def __setstate__(self, state):
+    _, slots = state
+    self.__init__()
+    for key, attr, _ in self.FIELDS:
+      self.set(key, slots.get(attr))
+    for key, value in (slots.get('extra') or {}).items():
+      self.set(key, value)
+
+  @classmethod
+  def from_dict(cls, d):
+    model = cls()
+    for key, value in d.items():
+      model.set(key, _from_json(value))
+    return model
+
+# A recording, from its details page or (with only a few fields set) from a
+# row of the table of recordings on an artist's page; `artists` is only set
+# for the former. `artists` maps roles to the ArtistRefs credited in them.
+class Recording(Model):
+  __slots__ = ('id', 'link', 'image_link', 'artists', 'title', 'other_titles', 'date',
+               'duration', 'genres', 'language', 'category', 'label', 'matrix_and_take',
+               'notes', 'place', 'related_takes', 'size', 'row_title', 'artist_role',
+               'primary_performers', 'extra')
+  FIELDS = [
+      (keys.ID, 'id', False),
+      (keys.REF_LINK, 'link', False),
+      (keys.IMAGE_LINK, 'image_link', False),
+      (keys.ARTISTS, 'artists', False),
+      (keys.RECORDING_TITLE, 'title', False),
+      (keys.OTHER_TITLES, 'other_titles', False),
+      (keys.RECORDING_DATE, 'date', False),
+      (keys.DURATION, 'duration', False),
+      (keys.GENRES, 'genres', True),
+      (keys.LANGUAGE, 'language', True),
+      (keys.CATEGORY, 'category', True),
+      (keys.LABEL_NAME_AND_NUMBER, 'label', False),
+      (keys.MATRIX_AND_TAKE_NUMBER, 'matrix_and_take', False),
+      (keys.NOTES, 'notes', False),
+      (keys.PLACE_OF_RECORDING, 'place', True),
+      (keys.RELATED_TAKES, 'related_takes', False),
+      (keys.SIZE, 'size', False),
+      (keys.TITLE, 'row_title', False),
+      (keys.ARTIST_ROLE, 'artist_role', True),
+      (keys.PRIMARY_PERFORMERS, 'primary_performers', False),
+  ]
+
+  def set(self, key, value):
+    if key == keys.ARTISTS and value is not None:
+      value = { sys.intern(role): refs for role, refs in value.items() }
+    super().set(key, value)
+
+# An artist, from their details page. `recordings` are Recordings, which only
+# have the fields in the artist's table of recordings if scraped shallowly.
+class Artist(Model):
+  __slots__ = ('id', 'link', 'name', 'alias', 'description', 'recordings', 'extra')
+  FIELDS = [
+      (keys.ID, 'id', False),
+      (keys.REF_LINK, 'link', False),
+      (keys.REF_NAME, 'name', False),
+      (keys.REF_ALIAS, 'alias', False),
+      (keys.DESCRPTION, 'description', False),
+      (keys.RECORDINGS, 'recordings', False),
+  ]
+
+  def set(self, key, value):
+    if key == keys.RECORDINGS and value is not None:
+      value = [ Recording.from_dict(rmd) if type(rmd) is dict else rmd for rmd in value ]
+    super().set(key, value)
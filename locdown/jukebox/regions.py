@@ -0,0 +1,57 @@
+from collections import namedtuple
+import re
+
+# Pre-slices raw HTML down to the elements the scraper actually reads, so the
+# parser only has to build a tree of those regions rather than the whole page.
+# Each region is the first element with the given tag and attribute value;
+# as with bs4's `find`, a class value without spaces matches any one of the
+# element's classes, while one with spaces must match the attribute exactly.
+
+Region = namedtuple('Region', 'tag attr value')
+
+VOID_TAGS = { 'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+              'link', 'meta', 'source', 'track', 'wbr' }
+
+def _open_tag_regex(region):
+  value = re.escape(region.value)
+  if region.attr == 'class' and region.value and not ' ' in region.value:
+    value = rf'["\']?(?:[^"\'>]*\s)?{value}(?:\s[^"\'>]*)?["\']?'
+  else:
+    value = rf'["\']?{value}["\']?'
+  return re.compile(
+      rf'<{region.tag}\b[^>]*(?<![\w-]){region.attr}\s*=\s*{value}(?=[\s/>])', re.I)
+
+def _element_span(html, match, tag):
+  if tag in VOID_TAGS:
+    end = html.find('>', match.end())
+    return (match.start(), end + 1) if end >= 0 else None
+
+  depth = 1
+  for token in re.finditer(rf'<(/?){tag}\b[^>]*>', html[match.end():], re.I):
+    depth += -1 if token.group(1) else 1
+    if depth == 0:
+      return match.start(), match.end() + token.end()
+  return None # Unbalanced; the caller should fall back to parsing in full
+
+# Returns the HTML of the given regions in document order, or None if the page
+# can't be sliced reliably.
+def extract(html, regions):
+  spans = []
+  for region in regions:
+    match = _open_tag_regex(region).search(html)
+    if match:
+      span = _element_span(html, match, region.tag.lower())
+      if not span:
+        return None
+      spans.append(span)
+
+  # Regions nested inside another region are already covered by it
+  slices, end = [], 0
+  for start, stop in sorted(spans):
+    if start >= end:
+      slices.append(html[start:stop])
+      end = stop
+    elif stop > end:
+      return None # Partially overlapping regions; should never happen
+
+  return '\n'.join(slices)
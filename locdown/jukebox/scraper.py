@@ -1,14 +1,35 @@
-from bs4 import BeautifulSoup
 import asyncio
-import functools, math, re
+import contextlib, itertools, math, re, sys
 
-from . import keys, url
+from . import backend, keys, url
+from .models import Artist, ArtistRef, Recording, Ref
+from ..resilience import TransientError
+from ..session import NotFoundError
+from .regions import Region
 
 A_HREF_REGEX = re.compile('\/jukebox\/([a-z]+)\/detail\/id\/(\d+)')
 HREF_URL_PREFIX = 'https://www.loc.gov'
 ALIAS_REGEX = re.compile('(.*) \[i.e., (.*)\]')
 ARTIST_RESULTS_REGEX = re.compile('Results: (\d+)-(\d+) of (\d+)')
 
+# The only parts of each page the scraper reads. The `innerbox` div holds the
+# error message on error and maintenance pages.
+DC_IDENTIFIER_REGION = Region('meta', 'name', 'DC.identifier')
+INNERBOX_REGION = Region('div', 'class', 'innerbox')
+RECORDING_REGIONS = [
+    DC_IDENTIFIER_REGION,
+    INNERBOX_REGION,
+    Region('a', 'class', 'enlarge lightbox'),
+    Region('div', 'id', 'tab1'),
+]
+ARTIST_REGIONS = [
+    DC_IDENTIFIER_REGION,
+    INNERBOX_REGION,
+    Region('div', 'id', 'page_head'),
+    Region('div', 'class', 'n_results'),
+    Region('table', 'id', 'artist-takes'),
+]
+
 def get_tag_text(tag):
   s = tag.get_text().strip()
   s = re.sub('\n|\t', ' ', s)
@@ -18,27 +39,26 @@ def get_tag_text(tag):
 
 # Convert <a> tags to refs
 
+# Sets the name (and alias, if any) of a Ref or Artist from its link text
 def unalias(ref, text):
   match = ALIAS_REGEX.match(text)
   if match:
-    ref[keys.REF_ALIAS] = match.group(1)
-    ref[keys.REF_NAME] = match.group(2)
+    ref.alias = match.group(1)
+    ref.name = match.group(2)
   else:
-    ref[keys.REF_NAME] = text
+    ref.name = text
   return ref
 
 def convert_a(a):
-  ref = { keys.REF_LINK: HREF_URL_PREFIX + a['href'].strip() }
+  link = HREF_URL_PREFIX + a['href'].strip()
   text = get_tag_text(a)
-  return unalias(ref, text)
+  return unalias((ArtistRef if ArtistRef.is_link(link) else Ref)(link), text)
 
 # True if `item` is an artist ref or a list of artist refs
 def is_artist_ref(item):
   if type(item) is list:
     return all([is_artist_ref(elem) for elem in item])
-  if keys.REF_LINK in item:
-    return '/artists/' in item[keys.REF_LINK]
-  return False
+  return isinstance(item, ArtistRef)
 
 def li_to_key_value(li):
   key = li.find('h3').get_text().strip()
@@ -79,17 +99,50 @@ def reformat_other_titles(titles):
     m[category] = m[category]
   return m
 
+# An unrecognized page is most likely a maintenance page, so it's worth retrying
 def raise_page_format_exception(url_):
-  raise RuntimeError(f'The page `{url_}` is in an unrecognized format! ' + \
+  raise TransientError(f'The page `{url_}` is in an unrecognized format! ' + \
                      'Check loc.gov; it may be down for maintenance.')
 
-async def get_soup(session, url_):
-  async with session.get(url_) as response:
-    data = await response.read()
-    html = data.decode('utf-8', errors='ignore')
-    return BeautifulSoup(html, 'html5lib')
-
-def do_page_structure_sanity_check(soup):
+# Pages without the DC.identifier meta tag are error or maintenance pages (see
+# `do_page_structure_sanity_check`), so they should never be cached.
+def is_details_page(data):
+  return b'DC.identifier' in data
+
+async def fetch_page(session, url_):
+  return await session.fetch(url_, is_cacheable=is_details_page)
+
+def make_soup(data, regions=None):
+  html = data.decode('utf-8', errors='ignore')
+  return backend.parse(html, regions)
+
+# Parsing is CPU-bound, so it can optionally be moved off the event loop into a
+# pool of worker processes. The parse_* functions below take raw page bytes
+# and return models (see models.py) so that both can be pickled across processes.
+_parse_pool = None
+
+@contextlib.contextmanager
+def parse_pool(workers):
+  global _parse_pool
+  if not workers:
+    yield
+    return
+
+  import concurrent.futures # Only needed with --parse-workers
+  _parse_pool = concurrent.futures.ProcessPoolExecutor(workers,
+      initializer=backend.configure, initargs=backend.get_config())
+  try:
+    yield
+  finally:
+    _parse_pool.shutdown(cancel_futures=True)
+    _parse_pool = None
+
+async def run_parser(fn, *args):
+  if not _parse_pool:
+    return fn(*args)
+  return await asyncio.get_running_loop().run_in_executor(_parse_pool, fn, *args)
+
+def do_page_structure_sanity_check(soup, url_):
   # The DC.identifier meta tag is found on both recording and artist details pages
   # If it's not there, the page is not structured as we expect it to be.
   if not soup.find('meta', { 'name': 'DC.identifier' }):
@@ -103,21 +156,16 @@ def do_page_structure_sanity_check(soup):
       # If all else fails, present a generic error
       raise_page_format_exception(url_)
 
-async def scrape_recording(session, id_):
-  url_ = url.id_to_details_url(id_, 'recordings')
-  soup = await get_soup(session, url_)
+def parse_recording(data, id_, url_):
+  soup = make_soup(data, RECORDING_REGIONS)
 
-  do_page_structure_sanity_check(soup)
+  do_page_structure_sanity_check(soup, url_)
 
-  details = {
-    keys.ID: id_,
-    keys.REF_LINK: url_,
-    keys.ARTISTS: {}, 
-  }
+  details = Recording(id=id_, link=url_, artists={})
 
   image = soup.find('a', { 'class': 'enlarge lightbox' })
   if image:
-    details[keys.IMAGE_LINK] = HREF_URL_PREFIX + image['href'].strip()
+    details.image_link = HREF_URL_PREFIX + image['href'].strip()
 
   for li in soup.select('#tab1 > ul > li'):
     key, value = li_to_key_value(li)
@@ -131,31 +179,59 @@ async def scrape_recording(session, id_):
     if is_artist_ref(value):
       aliases, reals = [], []
       for entry in value:
-        (aliases if keys.REF_ALIAS in entry else reals).append(entry)
+        (aliases if entry.alias is not None else reals).append(entry)
 
       for alias in aliases:
-        alias_real_name = alias.get(keys.REF_NAME)
-        real = next(filter(lambda r: r.get(keys.REF_NAME) == alias_real_name, reals), None)
+        alias_real_name = alias.name
+        real = next(filter(lambda r: r.name == alias_real_name, reals), None)
         if real:
-          alias[keys.REF_NAME] = alias.pop(keys.REF_ALIAS, None)
-          real[keys.REF_ALIAS] = alias
+          alias.name, alias.alias = alias.alias, None
+          real.alias = alias
 
-      details[keys.ARTISTS][key] = reals
+      details.artists[sys.intern(key)] = reals
     else:
-      details[key] = value
+      details.set(key, value)
 
   return details
 
-async def scrape_artist(session, id_, shallow=False):
-  url_ = url.id_to_details_url(id_, 'artists')
-  soup = await get_soup(session, url_)
+# In deep mode, only the ID of each row is needed; the rest is scraped from the
+# recording's own details page.
+def parse_artist_recordings_from_soup(soup, shallow):
+  table = soup.find('table', { 'id': 'artist-takes' })
+  col_names = [ get_tag_text(h) for h in table.select('tr > th') ]
+  rows = table.select('tbody > tr')
+
+  def get_row_metadata(row):
+    cols = row.find_all('td')
+    link = HREF_URL_PREFIX + cols[2].find('a')['href'].strip()
+    id_ = int(link.split('/')[-1])
+
+    row_metadata = Recording(id=id_)
+    if shallow:
+      row_metadata.link = link
+
+      img_src = cols[0].select_one('div > div > img')['src']
+      if img_src != '/jukebox/images/album_default.jpg': # No image available
+        row_metadata.image_link = HREF_URL_PREFIX + img_src
+
+      for i, col in enumerate(cols[1:]):
+        row_metadata.set(col_names[i+1], get_tag_text(col))
+
+    return row_metadata
+
+  return [ get_row_metadata(row) for row in rows ]
 
-  do_page_structure_sanity_check(soup)
+def parse_artist_recordings(data, shallow):
+  return parse_artist_recordings_from_soup(make_soup(data, ARTIST_REGIONS), shallow)
 
-  metadata = {
-      keys.ID: id_,
-      keys.REF_LINK: url_,
-  }
+# Returns the artist's metadata, including the recordings listed on the first
+# page of results, and the total number of pages of results.
+def parse_artist(data, id_, url_, shallow):
+  soup = make_soup(data, ARTIST_REGIONS)
+
+  do_page_structure_sanity_check(soup, url_)
+
+  metadata = Artist(id=id_, link=url_)
 
   name_h1 = soup.select_one('#page_head > h1')
   if not name_h1:
@@ -166,12 +242,12 @@ async def scrape_artist(session, id_, shallow=False):
   desc_p = soup.find('div', { 'class': 'innerbox' }).find('p', { 'class': '' })
   desc = get_tag_text(desc_p)
   if desc:
-    metadata[keys.DESCRPTION] = desc
+    metadata.description = desc
 
   n_results_div = soup.find('div', { 'class': 'n_results' })
   if not n_results_div:
-    metadata[keys.RECORDINGS] = []
-    return metadata # No recordings for this artist!
+    metadata.recordings = []
+    return metadata, 0 # No recordings for this artist!
 
   results_text = get_tag_text(n_results_div)
 
@@ -182,45 +258,67 @@ async def scrape_artist(session, id_, shallow=False):
   result_first, result_last, result_max = map(int, match.groups())
   num_pages = math.ceil(result_max/(result_last - result_first + 1))
 
-  async def scrape_artist_recordings_from_soup(soup):
-    table = soup.find('table', { 'id': 'artist-takes' })
-    col_names = [ get_tag_text(h) for h in table.select('tr > th') ]
-    rows = table.select('tbody > tr')
-
-    async def get_row_metadata(row):
-      cols = row.find_all('td')
-      link = HREF_URL_PREFIX + cols[2].find('a')['href'].strip()
-      id_ = int(link.split('/')[-1])
-
-      if not shallow:
-        return await scrape_recording(session, id_)
-      else:
-        row_metadata = {
-            keys.ID: id_,
-            keys.REF_LINK: link,
-        }
-
-        img_src = cols[0].select_one('div > div > img')['src']
-        if img_src != '/jukebox/images/album_default.jpg': # No image available
-          row_metadata[keys.IMAGE_LINK] = HREF_URL_PREFIX + img_src
-
-        for i, col in enumerate(cols[1:]):
-          row_metadata[col_names[i+1]] = get_tag_text(col)
+  metadata.recordings = parse_artist_recordings_from_soup(soup, shallow)
+  return metadata, num_pages
+
+# Fetches and parses a page, retrying both together according to the session's
+# retry policy, since e.g. a maintenance page is only detected when parsing.
+async def scrape_page(session, url_, parse_fn, *args):
+  async def attempt():
+    data = await fetch_page(session, url_)
+    return await run_parser(parse_fn, data, *args)
+  return await session.retry(attempt)
+
+# Scrapes the details page of an ID, keeping the session's ID map (if any) up
+# to date. IDs already known not to exist are not requested at all.
+async def scrape_details_page(session, domain, id_, parse_fn, *args):
+  url_ = url.id_to_details_url(id_, domain)
+  if session.id_map and session.id_map.is_invalid(domain, id_):
+    raise NotFoundError(f'{url_} does not exist')
+
+  try:
+    result = await scrape_page(session, url_, parse_fn, id_, url_, *args)
+  except NotFoundError:
+    if session.id_map:
+      session.id_map.mark(domain, id_, False)
+    raise
+
+  if session.id_map:
+    session.id_map.mark(domain, id_, True)
+  return result
+
+# Each recording and artist is only scraped once per session, however many
+# times (or however many tasks at once) it is asked for; see memo.py.
+async def scrape_recording(session, id_):
+  return await session.memo(('recordings', id_),
+                            scrape_details_page, session, 'recordings', id_, parse_recording)
 
-        return row_metadata
+async def scrape_artist(session, id_, shallow=False):
+  return await session.memo(('artists', id_, shallow), scrape_artist_uncached, session, id_, shallow)
 
-    return await asyncio.gather(*map(get_row_metadata, rows))
+async def scrape_artist_uncached(session, id_, shallow):
+  url_ = url.id_to_details_url(id_, 'artists')
+  metadata, num_pages = await scrape_details_page(session, 'artists', id_, parse_artist, shallow)
 
   async def scrape_artist_recordings(page_num):
-    soup = await get_soup(session, f'{url_}?page={page_num}')
-    return await scrape_artist_recordings_from_soup(soup)
+    return await scrape_page(session, f'{url_}?page={page_num}',
+                             parse_artist_recordings, shallow)
 
-  # Download and scrape pages 2+ only; we already downloaded page 1 above
+  # Download and scrape pages 2+ only; we already downloaded page 1 above.
+  # However many there are, the requests wait their turn in the session's
+  # scheduler (see concurrency.py), sharing it with the rest of the run.
   tasks = map(scrape_artist_recordings, range(2, num_pages+1))
   pages = await asyncio.gather(*tasks)
 
-  metadata[keys.RECORDINGS] = functools.reduce(
-      lambda accum, recordings: accum + recordings,
-      pages, await scrape_artist_recordings_from_soup(soup))
+  recordings = list(itertools.chain(metadata.recordings, *pages))
+
+  if session.id_map:
+    for row in recordings:
+      session.id_map.mark('recordings', row.id, True)
+
+  if not shallow:
+    recordings = await asyncio.gather(*[ scrape_recording(session, row.id) \
+                                         for row in recordings ])
 
+  metadata.recordings = recordings
   return metadata
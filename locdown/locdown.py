@@ -1,28 +1,64 @@
-import aiohttp, asyncio, contextlib
-
-from fake_useragent import UserAgent
+import asyncio, contextlib, importlib
 
 from .argparser import parse_args
-from . import action, config, util
+from .concurrency import AdaptiveLimiter, Scheduler, TokenBucket
+from .idmap import IDMap
+from .pagecache import PageCache
+from .resilience import CircuitBreaker, RetryPolicy
+from .session import Session
+from . import config, id, jukebox, util
+
+# Actions are imported only when run, so that e.g. printing stream URLs
+# doesn't have to import everything that downloading needs
+def import_action(name):
+  return getattr(importlib.import_module(f'.action.{name}', __package__), name)
 
 async def main_task(args):
-  # Fix erroneous timeouts when scraping large amounts of metadata
-  # There is probably a better way to do this, but this is good enough
-  timeout = aiohttp.ClientTimeout(total=15*60, connect=None, sock_connect=None, sock_read=None)
-  async with aiohttp.ClientSession(timeout=timeout,
-        connector=aiohttp.TCPConnector(limit=args.max_connections),
-        headers={ 'User-Agent': UserAgent().chrome }) as session:
-    if args.action == 'download':
-      await action.download(session, args, args.max_connections)
-    elif args.action == 'scrape':
-      await action.scrape(session, args)
-    elif args.action == 'stream':
-      await action.stream(session, args)
+  run = import_action(args.action)
+
+  # Searching only reads the local catalog, and unpacking a local pack
+  if args.action == 'search':
+    return run(args)
+  elif args.action == 'unpack':
+    return await run(args)
+
+  jukebox.backend.set_backend(args.parser)
+  jukebox.backend.set_partial_parsing(not args.full_parse)
+  id.MAX_ID_PROBE_WIDTH = args.probe_width
+
+  cache = PageCache(ttl=args.cache_ttl, revalidate=args.action == 'sync') \
+      if getattr(args, 'cache', False) else None
+  limiter = AdaptiveLimiter() if args.max_connections == 'auto' else None
+
+  # Made on the first request, if any; see session.py
+  def make_client():
+    import aiohttp
+
+    # Fix erroneous timeouts when scraping large amounts of metadata
+    # There is probably a better way to do this, but this is good enough
+    timeout = aiohttp.ClientTimeout(total=15*60, connect=None, sock_connect=None, sock_read=None)
+    return aiohttp.ClientSession(timeout=timeout,
+        connector=aiohttp.TCPConnector(limit=limiter.maximum if limiter else args.max_connections),
+        headers={ 'User-Agent': config.USER_AGENT })
+
+  retry = RetryPolicy(args.retries, args.backoff, breaker=CircuitBreaker())
+  rate_limiter = TokenBucket(args.rate, args.burst) if args.rate else None
+  id_map = IDMap()
+  for type_ in id.IDType:
+    id_map.set_max_id(type_.value + 's', id.get_max_id(type_) or id.MAX_ID_VALUES[type_])
+  scheduler = Scheduler(limiter or args.max_connections)
+  async with Session(make_client, cache=cache, limiter=limiter, scheduler=scheduler, retry=retry,
+                     rate_limiter=rate_limiter, id_map=id_map) as session:
+    with jukebox.parse_pool(args.parse_workers), contextlib.closing(id_map):
+      if args.action == 'download':
+        await run(session, args, limiter or args.max_connections)
+      else:
+        await run(session, args)
 
 def main(argv):
   # Create the data directory if it does not exist
   if not config.USER_DATA_DIR.is_dir():
-    config.mkdir(parents=True, exist_ok=True)
+    config.USER_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
   args = parse_args(argv)
 
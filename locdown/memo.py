@@ -0,0 +1,36 @@
+import asyncio, collections
+
+DEFAULT_MAX_SIZE = 4096 # Number of results kept
+
+# Coalesces concurrent calls with the same key into a single call, and keeps
+# the most recent results so that later calls can reuse them (i.e. a
+# "singleflight" in front of a bounded LRU cache). Failures are not kept.
+# Results are shared between callers, so they must not be mutated.
+class Memo:
+  def __init__(self, max_size=DEFAULT_MAX_SIZE):
+    self.max_size = max_size
+    self.results = collections.OrderedDict()
+    self.in_flight = {}
+
+  async def __call__(self, key, fn, *args, **kwargs):
+    if key in self.results:
+      self.results.move_to_end(key)
+      return self.results[key]
+
+    task = self.in_flight.get(key)
+    if not task:
+      task = asyncio.ensure_future(fn(*args, **kwargs))
+      task.add_done_callback(lambda task: self._done(key, task))
+      self.in_flight[key] = task
+
+    # A caller being cancelled shouldn't cancel the call for everyone else
+    return await asyncio.shield(task)
+
+  def _done(self, key, task):
+    del self.in_flight[key]
+    if task.cancelled() or task.exception():
+      return
+
+    self.results[key] = task.result()
+    if len(self.results) > self.max_size:
+      self.results.popitem(last=False)
@@ -0,0 +1,117 @@
+import json, mmap, os, pathlib, struct
+
+PACK_PREFIX = 'locdown-pack'
+INDEX_FILENAME = f'{PACK_PREFIX}.index'
+DEFAULT_SHARD_SIZE = 64 * 2**20 # In bytes; a shard is never split across records
+
+RECORDING = 'recording'
+ARTIST = 'artist'
+TYPES = [ RECORDING, ARTIST ] # Stored in the index by position
+
+# Type, ID, shard number, offset in the shard and length of a record
+INDEX_ENTRY = struct.Struct('<BIHQI')
+
+def is_pack(path):
+  return pathlib.Path(path).joinpath(INDEX_FILENAME).is_file()
+
+# Scraped metadata packed into a few large files rather than a file apiece.
+# Records (one artist or recording each, as a line of JSON) are appended to
+# numbered shard files of up to `shard_size` bytes, and a fixed-size entry for
+# each is appended to a side index, which is read into memory when the pack is
+# opened. A record can then be read from its shard, which is memory-mapped,
+# without reading anything else.
+#
+# Both files are only ever appended to: a record added again, e.g. by a later
+# scrape, supersedes the old one in the index, but the old one stays in its
+# shard. The index entry is written after the record, so a pack cut short
+# while writing is still consistent, if missing its last records.
+class Pack:
+  def __init__(self, path, shard_size=DEFAULT_SHARD_SIZE):
+    self.path = pathlib.Path(path)
+    self.shard_size = shard_size
+    self.entries = {} # (type, id) -> (shard, offset, length)
+    self.maps = {}
+    self.shard = None
+    self.index = None
+
+    self.index_path = self.path.joinpath(INDEX_FILENAME)
+    self.index_size = 0
+    if self.index_path.is_file():
+      data = self.index_path.read_bytes()
+      self.index_size = len(data) - len(data) % INDEX_ENTRY.size # Without a partial entry
+      data = data[:self.index_size]
+      for type_, id_, shard, offset, length in INDEX_ENTRY.iter_unpack(data):
+        self.entries[(TYPES[type_], id_)] = (shard, offset, length)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self, key):
+    return key in self.entries
+
+  def _shard_path(self, shard):
+    return self.path.joinpath(f'{PACK_PREFIX}-{shard:05d}.ndjson')
+
+  def _open_for_append(self):
+    self.path.mkdir(parents=True, exist_ok=True)
+    shard = max((shard for shard, _, _ in self.entries.values()), default=0)
+    self.shard = (shard, self._shard_path(shard).open('ab'))
+    self.index = self.index_path.open('ab')
+    self.index.truncate(self.index_size)
+
+  # `data` is the record's JSON, on one line
+  def add(self, type_, id_, data):
+    if not self.index:
+      self._open_for_append()
+
+    shard, f = self.shard
+    offset = f.tell()
+    if offset and offset + len(data) > self.shard_size:
+      f.close()
+      shard, offset = shard + 1, 0
+      f = self._shard_path(shard).open('ab')
+      self.shard = (shard, f)
+
+    f.write(data)
+    f.flush()
+    self.index.write(INDEX_ENTRY.pack(TYPES.index(type_), id_, shard, offset, len(data)))
+    self.index.flush()
+    self.entries[(type_, id_)] = (shard, offset, len(data))
+
+  # Flushes everything written so far to disk
+  def sync(self):
+    if self.index:
+      os.fsync(self.shard[1].fileno())
+      os.fsync(self.index.fileno())
+
+  def _map(self, shard, end):
+    if not shard in self.maps or len(self.maps[shard]) < end:
+      with self._shard_path(shard).open('rb') as f:
+        self.maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return self.maps[shard]
+
+  def get_raw(self, type_, id_):
+    shard, offset, length = self.entries[(type_, id_)]
+    return self._map(shard, offset + length)[offset:offset + length]
+
+  def get(self, type_, id_):
+    return json.loads(self.get_raw(type_, id_))
+
+  # Every (type, ID) in the pack, in the order they were first added
+  def keys(self):
+    return self.entries.keys()
+
+  def close(self):
+    if self.index:
+      self.shard[1].close()
+      self.index.close()
+      self.index = None
+    for m in self.maps.values():
+      m.close()
+    self.maps = {}
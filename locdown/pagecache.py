@@ -0,0 +1,91 @@
+from collections import namedtuple
+import hashlib, json, os, pathlib, time
+
+from . import config
+
+CACHE_DIR = config.USER_DATA_DIR.joinpath('cache', 'pages')
+DEFAULT_TTL = config.DEFAULT_CACHE_TTL
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024 # In bytes
+EVICTION_LOW_WATER = 0.9 # Evict down to this fraction of max_size
+
+class Entry(namedtuple('Entry', 'body etag last_modified expires')):
+  def is_fresh(self):
+    return self.expires > time.time()
+
+# A persistent cache of page bodies keyed by URL. Each entry is a single file
+# whose first line is a JSON header (URL, validators and expiry time) and whose
+# remainder is the raw body. A file's mtime is bumped whenever it is read, so
+# evicting the oldest mtimes first gives LRU order.
+#
+# With `revalidate`, entries are never considered fresh, so every hit is
+# checked with loc.gov (cheaply, if it supports conditional requests).
+class PageCache:
+  def __init__(self, path=CACHE_DIR, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE,
+               revalidate=False):
+    self.path = pathlib.Path(path)
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.ttl = ttl
+    self.max_size = max_size
+    self.revalidate = revalidate
+    self.size = sum(p.stat().st_size for p in self.path.iterdir() if p.is_file())
+
+  def _entry_path(self, url):
+    return self.path.joinpath(hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+  def get(self, url):
+    path = self._entry_path(url)
+    try:
+      with path.open('rb') as f:
+        header = json.loads(f.readline())
+        body = f.read()
+      os.utime(path)
+    except (OSError, ValueError):
+      return None
+
+    if header.get('url') != url:
+      return None # Hash collision; treat as a miss
+
+    return Entry(body, header.get('etag'), header.get('last_modified'), header.get('expires', 0))
+
+  def put(self, url, body, etag=None, last_modified=None, ttl=None):
+    header = {
+        'url': url,
+        'etag': etag,
+        'last_modified': last_modified,
+        'expires': time.time() + (self.ttl if ttl is None else ttl),
+    }
+    path = self._entry_path(url)
+    tmp_path = path.with_suffix('.tmp')
+    with tmp_path.open('wb') as f:
+      f.write(json.dumps(header).encode('utf-8'))
+      f.write(b'\n')
+      f.write(body)
+
+    old_size = path.stat().st_size if path.is_file() else 0
+    new_size = tmp_path.stat().st_size
+    os.replace(tmp_path, path)
+
+    self.size += new_size - old_size
+    if self.size > self.max_size:
+      self.evict()
+
+  def evict(self):
+    entries = []
+    for p in self.path.iterdir():
+      try:
+        stat = p.stat()
+      except OSError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, p))
+    entries.sort()
+
+    self.size = sum(size for _, size, _ in entries)
+    target = self.max_size * EVICTION_LOW_WATER
+    for _, size, p in entries:
+      if self.size <= target:
+        break
+      try:
+        p.unlink()
+      except OSError:
+        continue
+      self.size -= size
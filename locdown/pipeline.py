@@ -0,0 +1,97 @@
+from collections import namedtuple
+import asyncio, contextlib
+
+from .concurrency import new_group
+
+# One step of a Pipeline. `fn` is a coroutine function that is called on each
+# item from the previous stage by a pool of `workers` workers. It returns a
+# list of items for the next stage (which may be empty, e.g. to drop the item,
+# or longer than one, to fan out), or None if the item failed.
+Stage = namedtuple('Stage', 'name fn workers')
+
+# Runs items through a chain of stages connected by bounded queues, so that
+# every stage works at once and a slow stage holds back the ones before it
+# rather than letting work pile up in memory.
+#
+# For progress monitoring, `state.num_total` counts the items that will come
+# out of the last stage, as far as is known so far: it grows when a stage fans
+# an item out. `state.num_done` counts items that have come out of the last
+# stage or failed, and `state.stages` holds the number of items queued in or
+# being processed by each stage, by name.
+#
+# Each call of a stage's `fn` is a group of its own to the session's scheduler
+# (see concurrency.py), as with TaskBatch.
+class Pipeline:
+  _DONE = object()
+
+  def __init__(self, stages, monitor=None, monitor_interval=1, queue_factor=2):
+    self.stages = stages
+    self.monitor = monitor
+    self.monitor_interval = monitor_interval
+    self.queue_factor = queue_factor
+    self.state = type('state', (), {
+      'num_done': 0,
+      'num_total': 0,
+      'stages': { stage.name: 0 for stage in stages } })
+
+  # `items` may be any iterable with a length; it is only iterated over as the
+  # first stage has room for more
+  async def run(self, items):
+    self.state.num_total = len(items)
+    queues = [ asyncio.Queue(maxsize=stage.workers * self.queue_factor)
+               for stage in self.stages ]
+
+    async def feed():
+      for item in items:
+        self.state.stages[self.stages[0].name] += 1
+        await queues[0].put(item)
+      for _ in range(self.stages[0].workers):
+        await queues[0].put(self._DONE)
+
+    async def worker(i):
+      stage = self.stages[i]
+      next_stage = self.stages[i+1] if i+1 < len(self.stages) else None
+      while True:
+        item = await queues[i].get()
+        if item is self._DONE:
+          return
+
+        with new_group():
+          results = await stage.fn(item)
+        self.state.stages[stage.name] -= 1
+        if results is None or not next_stage:
+          self.state.num_done += 1
+          continue
+
+        self.state.num_total += len(results) - 1
+        for result in results:
+          self.state.stages[next_stage.name] += 1
+          await queues[i+1].put(result)
+
+    # Once every worker of a stage has finished, so has the stage
+    async def run_stage(i):
+      await asyncio.gather(*(worker(i) for _ in range(self.stages[i].workers)))
+      if i+1 < len(self.stages):
+        for _ in range(self.stages[i+1].workers):
+          await queues[i+1].put(self._DONE)
+
+    async def monitor_task():
+      while True:
+        if self.state.num_done < self.state.num_total:
+          self.monitor(self.state)
+        await asyncio.sleep(self.monitor_interval)
+
+    tasks = [ asyncio.ensure_future(feed()) ] + \
+            [ asyncio.ensure_future(run_stage(i)) for i in range(len(self.stages)) ]
+    helpers = [ asyncio.ensure_future(monitor_task()) ] if self.monitor else []
+
+    try:
+      await asyncio.gather(*tasks)
+    finally:
+      for task in tasks + helpers:
+        task.cancel()
+      with contextlib.suppress(asyncio.CancelledError):
+        await asyncio.gather(*tasks, *helpers, return_exceptions=True)
+
+    if self.monitor and self.state.num_total:
+      self.monitor(self.state)
@@ -6,6 +6,8 @@ class Padding(Enum):
   NONE = None
 
 from .bar import Bar
+from .concurrency import Concurrency
 from .fraction import Fraction
 from .percent import Percent
 from .spinner import Spinner
+from .stages import Stages
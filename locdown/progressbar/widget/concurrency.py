@@ -0,0 +1,16 @@
+class Concurrency:
+
+  CHARS_SPARKLINE = '▁▂▃▄▅▆▇█'
+
+  # `limiter` is anything with `limit` and `history` attributes,
+  # e.g. an AdaptiveLimiter
+  def __init__(self, limiter, history_width=8, chars=CHARS_SPARKLINE):
+    self.limiter = limiter
+    self.history_width = history_width
+    self.chars = chars
+
+  def __call__(self, width, state):
+    history = list(self.limiter.history)[-self.history_width:]
+    scale = len(self.chars) / (max(history) + 1)
+    sparkline = ''.join(self.chars[int(value * scale)] for value in history)
+    return f'{sparkline} {self.limiter.limit}'
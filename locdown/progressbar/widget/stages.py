@@ -0,0 +1,9 @@
+class Stages:
+
+  # Shows the number of items in each stage of a Pipeline (see pipeline.py),
+  # which `state.stages` maps from stage names
+  def __init__(self, separator=' › '):
+    self.separator = separator
+
+  def __call__(self, width, state):
+    return self.separator.join(f'{name} {depth}' for name, depth in state.stages.items())
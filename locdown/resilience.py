@@ -0,0 +1,106 @@
+import asyncio, random, sys, time
+
+from . import config, util
+
+DEFAULT_RETRIES = config.DEFAULT_RETRIES
+DEFAULT_BACKOFF = config.DEFAULT_BACKOFF
+MAX_BACKOFF = 60
+BREAKER_THRESHOLD = 10 # Consecutive failures before all requests are paused
+BREAKER_COOLDOWN = 30 # In seconds; doubled each time the breaker re-trips
+BREAKER_MAX_COOLDOWN = 10 * 60
+
+# An error that is likely to go away if the operation is retried later, e.g.
+# an overloaded server or a maintenance page. `retry_after` is the number of
+# seconds the server asked us to wait, if any.
+class TransientError(RuntimeError):
+  def __init__(self, message, retry_after=None):
+    super().__init__(message)
+    self.retry_after = retry_after
+
+# The errors worth retrying. aiohttp is only imported once a request is made
+# (see session.py), and none of its errors can be raised before then.
+def transient_errors():
+  aiohttp = sys.modules.get('aiohttp')
+  return (TransientError, asyncio.TimeoutError) + ((aiohttp.ClientError,) if aiohttp else ())
+
+# Parses a Retry-After header, which is either a number of seconds or a date
+def parse_retry_after(value):
+  if not value:
+    return None
+  if value.strip().isdigit():
+    return int(value)
+  import email.utils
+  try:
+    return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+  except (TypeError, ValueError):
+    return None
+
+# Stops all requests for a while once enough consecutive requests have failed,
+# i.e. when loc.gov is clearly down, rather than letting every worker burn
+# through its retries. After the cooldown, requests are let through again; if
+# they keep failing, the breaker re-trips with a longer cooldown.
+class CircuitBreaker:
+  def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+    self.threshold = threshold
+    self.initial_cooldown = cooldown
+    self.cooldown = cooldown
+    self.failures = 0
+    self.open_until = 0
+
+  def is_open(self):
+    return time.monotonic() < self.open_until
+
+  async def wait(self):
+    while self.is_open():
+      await asyncio.sleep(self.open_until - time.monotonic())
+
+  def trip(self, duration):
+    if not self.is_open():
+      util.eprint(f'\nwarning: loc.gov appears to be unavailable; pausing for {duration:.0f}s')
+    self.open_until = max(self.open_until, time.monotonic() + duration)
+
+  def record_success(self):
+    self.failures = 0
+    self.cooldown = self.initial_cooldown
+
+  def record_failure(self, retry_after=None):
+    self.failures += 1
+    if retry_after:
+      self.trip(retry_after)
+    elif self.failures >= self.threshold and not self.is_open():
+      self.trip(self.cooldown)
+      self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+
+# Calls a coroutine function, retrying it on transient errors with exponential
+# backoff and jitter, and honoring any Retry-After the server sent.
+class RetryPolicy:
+  def __init__(self, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, breaker=None):
+    self.retries = retries
+    self.backoff = backoff
+    self.breaker = breaker
+
+  def delay(self, attempt, retry_after=None):
+    if retry_after:
+      return retry_after
+    delay = min(self.backoff * 2**attempt, MAX_BACKOFF)
+    return delay/2 + random.uniform(0, delay/2)
+
+  async def __call__(self, fn, *args, **kwargs):
+    attempt = 0
+    while True:
+      if self.breaker:
+        await self.breaker.wait()
+      try:
+        result = await fn(*args, **kwargs)
+      except transient_errors() as e:
+        retry_after = getattr(e, 'retry_after', None)
+        if self.breaker:
+          self.breaker.record_failure(retry_after)
+        if attempt >= self.retries:
+          raise
+        await asyncio.sleep(self.delay(attempt, retry_after))
+        attempt += 1
+      else:
+        if self.breaker:
+          self.breaker.record_success()
+        return result
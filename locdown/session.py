@@ -0,0 +1,122 @@
+import asyncio, contextlib, time
+
+from .memo import Memo
+from .resilience import RetryPolicy, TransientError, parse_retry_after
+
+# Responses that indicate the server is overloaded
+OVERLOAD_STATUSES = { 429, 500, 502, 503, 504 }
+
+# Raised for pages that do not exist, i.e. requests for invalid IDs
+class NotFoundError(RuntimeError):
+  pass
+
+# Thin wrapper around an aiohttp.ClientSession. Plain requests (e.g. for album
+# art, or existence checks) go through `get` and `head`, exactly as with the
+# underlying session; page fetches go through `fetch`, which consults the
+# on-disk page cache if one is enabled.
+# If a scheduler is given (see concurrency.py), every request waits for a slot
+# from it, however deeply nested in other work it is, rather than queueing in
+# aiohttp's connector (where waiting counts against the request's timeout).
+# If an adaptive limiter is given, every request reports its outcome to it; it
+# should be the scheduler's limit. `retry` is the RetryPolicy used by
+# the scraper and downloader for operations built on this session.
+#
+# If a rate limiter (a TokenBucket) is given, every request waits for it, as
+# should anything else that hits loc.gov on the session's behalf (e.g. rtmpdump
+# launches); see `throttle`.
+#
+# `id_map` (see idmap.py), if given, records which IDs are known to exist.
+# `memo` coalesces and reuses scrapes of the same page within a run.
+#
+# The underlying session is only made, by calling `make_session`, when the
+# first request is; runs that never touch the network (e.g. printing stream
+# URLs) then never have to import aiohttp, which is slow to import. Using the
+# Session as an async context manager closes it, if it was made.
+class Session:
+  def __init__(self, make_session, cache=None, limiter=None, scheduler=None, retry=None,
+               rate_limiter=None, id_map=None, memo=None):
+    self.make_session = make_session
+    self._session = None
+    self.cache = cache
+    self.limiter = limiter
+    self.scheduler = scheduler
+    self.retry = retry or RetryPolicy(retries=0)
+    self.rate_limiter = rate_limiter
+    self.id_map = id_map
+    self.memo = memo or Memo()
+
+  @property
+  def session(self):
+    if self._session is None:
+      self._session = self.make_session()
+    return self._session
+
+  async def close(self):
+    if self._session is not None:
+      await self._session.close()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.close()
+
+  async def throttle(self):
+    if self.rate_limiter:
+      await self.rate_limiter.acquire()
+
+  def get(self, url, **kwargs):
+    return self.request('GET', url, **kwargs)
+
+  def head(self, url, **kwargs):
+    return self.request('HEAD', url, **kwargs)
+
+  @contextlib.asynccontextmanager
+  async def request(self, method, url, **kwargs):
+    async with self.scheduler or contextlib.nullcontext():
+      await self.throttle()
+      if not self.limiter:
+        async with self.session.request(method, url, **kwargs) as response:
+          yield response
+        return
+
+      import aiohttp # Already imported by make_session; see above
+      started = time.monotonic()
+      try:
+        async with self.session.request(method, url, **kwargs) as response:
+          self.limiter.report(started, not response.status in OVERLOAD_STATUSES)
+          yield response
+      except (aiohttp.ClientError, asyncio.TimeoutError):
+        self.limiter.report(started, False)
+        raise
+
+  # `is_cacheable` is called on a freshly-fetched body and decides whether it
+  # should be stored; this keeps e.g. maintenance pages out of the cache.
+  async def fetch(self, url, is_cacheable=None):
+    entry = self.cache.get(url) if self.cache else None
+    if entry and entry.is_fresh() and not self.cache.revalidate:
+      return entry.body
+
+    headers = {}
+    if entry and entry.etag:
+      headers['If-None-Match'] = entry.etag
+    if entry and entry.last_modified:
+      headers['If-Modified-Since'] = entry.last_modified
+
+    async with self.get(url, headers=headers) as response:
+      if entry and response.status == 304:
+        self.cache.put(url, entry.body, entry.etag, entry.last_modified)
+        return entry.body
+
+      if response.status == 404:
+        raise NotFoundError(f'{url} does not exist (HTTP 404)')
+      if response.status in OVERLOAD_STATUSES:
+        raise TransientError(f'{url} returned HTTP {response.status}',
+            retry_after=parse_retry_after(response.headers.get('Retry-After')))
+
+      data = await response.read()
+      if self.cache and response.status == 200 and \
+          (not is_cacheable or is_cacheable(data)):
+        self.cache.put(url, data,
+            response.headers.get('ETag'), response.headers.get('Last-Modified'))
+      return data
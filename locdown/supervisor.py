@@ -0,0 +1,113 @@
+from collections import deque, namedtuple
+import asyncio, os, re, time
+
+from . import config
+from .resilience import TransientError
+
+DEFAULT_MAX_PROCESSES = config.DEFAULT_MAX_PROCESSES
+DEFAULT_STALL_TIMEOUT = config.DEFAULT_STALL_TIMEOUT
+STDERR_LINES_KEPT = 20 # For error messages
+PROGRESS_REGEX = re.compile(rb'([\d.]+) kB / [\d.]+ sec')
+LINE_SEP_REGEX = re.compile(rb'[\r\n]')
+
+ProcessStats = namedtuple('ProcessStats', 'bytes duration cpu_time')
+
+# CPU time used by a running process so far, in seconds, or None where /proc
+# is unavailable (i.e. outside of Linux)
+def _cpu_time(pid):
+  try:
+    with open(f'/proc/{pid}/stat', 'rb') as f:
+      fields = f.read().rsplit(b')', 1)[1].split()
+  except (OSError, IndexError):
+    return None
+  utime, stime = int(fields[11]), int(fields[12])
+  return (utime + stime) / os.sysconf('SC_CLK_TCK')
+
+# Runs rtmpdump processes, at most `max_processes` at once (independently of
+# the limit on HTTP connections). stderr is read as it is written rather than
+# buffered: rtmpdump's progress lines are used to kill any process that hasn't
+# made progress for `stall_timeout` seconds, and only the last few other lines
+# are kept, for error messages. A process is always killed and reaped if the
+# task running it is cancelled.
+#
+# Each run returns the process's ProcessStats, and running totals are kept in
+# `totals` (as a ProcessStats) along with the number of processes run and
+# killed.
+class Supervisor:
+  def __init__(self, max_processes=DEFAULT_MAX_PROCESSES, stall_timeout=DEFAULT_STALL_TIMEOUT):
+    self.max_processes = max_processes
+    self.stall_timeout = stall_timeout
+    self.semaphore = asyncio.Semaphore(max_processes)
+    self.totals = ProcessStats(0, 0, 0)
+    self.num_run = 0
+    self.num_killed = 0
+
+  # Returns (stdout, stats); stdout is None unless `stdout` is a pipe
+  async def run(self, program, *args, stdout=asyncio.subprocess.PIPE):
+    async with self.semaphore:
+      started = time.monotonic()
+      proc = await asyncio.create_subprocess_exec(program, *args,
+          stdout=stdout, stderr=asyncio.subprocess.PIPE)
+
+      progress = 0
+      last_progress = started
+      cpu_time = None
+      lines = deque(maxlen=STDERR_LINES_KEPT)
+
+      async def read_stderr():
+        nonlocal progress, last_progress, cpu_time
+        pending = b''
+        while True:
+          chunk = await proc.stderr.read(4096)
+          if not chunk:
+            break
+          *complete, pending = LINE_SEP_REGEX.split(pending + chunk)
+          for line in complete:
+            match = PROGRESS_REGEX.search(line)
+            if not match:
+              if line.strip():
+                lines.append(line)
+              continue
+            kb = float(match.group(1))
+            if kb * 1024 > progress:
+              progress = int(kb * 1024)
+              last_progress = time.monotonic()
+            cpu_time = _cpu_time(proc.pid) or cpu_time
+        if pending.strip():
+          lines.append(pending)
+
+      async def watch():
+        while time.monotonic() - last_progress < self.stall_timeout:
+          await asyncio.sleep(self.stall_timeout - (time.monotonic() - last_progress))
+
+      reader = asyncio.ensure_future(read_stderr())
+      output = asyncio.ensure_future(proc.stdout.read()) if proc.stdout else None
+      watcher = asyncio.ensure_future(watch())
+      try:
+        await asyncio.wait([ reader, watcher ], return_when=asyncio.FIRST_COMPLETED)
+        stalled = not reader.done()
+        if stalled:
+          proc.kill()
+        data = await output if output else None
+        await reader
+        cpu_time = _cpu_time(proc.pid) or cpu_time # Final reading, if not yet reaped
+        await proc.wait()
+      finally:
+        for task in [ reader, watcher ] + ([ output ] if output else []):
+          task.cancel()
+        if proc.returncode is None:
+          proc.kill()
+          await proc.wait()
+
+      stats = ProcessStats(len(data) if data is not None else progress,
+                           time.monotonic() - started, cpu_time or 0)
+      self.num_run += 1
+      self.totals = ProcessStats(*(total + value for total, value in zip(self.totals, stats)))
+
+    if stalled:
+      self.num_killed += 1
+      raise TransientError(f'{program} made no progress for {self.stall_timeout}s and was killed')
+    if proc.returncode != 0:
+      errstr = b'\n'.join(lines).decode('utf-8', errors='ignore')
+      raise TransientError(f'{program.capitalize()} failed:\n\n{errstr}')
+    return data, stats
@@ -1,2 +1,2 @@
-from .tagger import tag
+from .tagger import tag, tag_header
 from .tagmaker import filename as make_filename, dirname as make_dirname
@@ -1,29 +1,44 @@
 from mutagen import id3, mp3
 
-import mimetypes
+import asyncio, io, mimetypes
 
-from ..jukebox import keys
 from . import tagmaker
 
-async def tag(path, metadata, session=None):
-  audio = mp3.MP3(path)
-  audio.tags = id3.ID3()
+def make_tags(metadata, art=None):
+  tags = id3.ID3()
 
   for maker in tagmaker.tag_makers:
     tag = maker(metadata)
     if tag:
-      audio.tags.add(tag)
+      tags.add(tag)
 
-  if keys.IMAGE_LINK in metadata:
-    url = metadata.get(keys.IMAGE_LINK)
-    if session:
+  if metadata.image_link is not None:
+    url = metadata.image_link
+    if art:
       mime, _ = mimetypes.guess_type(url)
-      async with session.get(url) as response:
-        data = await response.read()
-        audio.tags.add(id3.APIC(encoding=id3.Encoding.UTF8, mime=mime, type=id3.PictureType.COVER_FRONT, desc='Front cover', data=data))
+      tags.add(id3.APIC(encoding=id3.Encoding.UTF8, mime=mime, type=id3.PictureType.COVER_FRONT, desc='Front cover', data=art))
     else:
       # In practice, this is unsupported by most media players
       # But there's no reason not to do it
-      audio.tags.add(id3.APIC(data=url, mime='-->'))
+      tags.add(id3.APIC(data=url.encode('latin-1', errors='ignore'), mime='-->'))
+
+  return tags
 
+def write_tags(path, metadata, art=None):
+  audio = mp3.MP3(path)
+  audio.tags = make_tags(metadata, art)
   audio.save()
+
+# Tags an existing file. Saving rewrites the whole file to make room for the
+# tag at the start, so it's done on a worker thread.
+# `art` is the image data at the metadata's image link, if it was fetched (see
+# artcache.py); otherwise only the link itself is embedded.
+async def tag(path, metadata, art=None):
+  await asyncio.to_thread(write_tags, path, metadata, art)
+
+# The serialized tag alone, for writing to a file before its audio, so that
+# the file never has to be rewritten (see jukebox.download_recording)
+def tag_header(metadata, art=None):
+  f = io.BytesIO()
+  make_tags(metadata, art).save(f, padding=lambda info: 0)
+  return f.getvalue()
@@ -2,45 +2,48 @@ from mutagen import id3
 
 from .. import util
 from ..jukebox import keys
+from ..jukebox.models import Recording
 
-def _tag_transform(m, tag, f, *keys):
-  for key in keys:
-    if not key in m:
-      return None
-    m = m.get(key)
+def _tag_transform(value, tag, f):
+  if value is None:
+    return None
   if f:
-    m = f(m)
-  return tag(text=m)
+    value = f(value)
+  return tag(text=value)
 
-def _tag(m, tag, *keys):
-  return _tag_transform(m, tag, None, *keys)
+def _tag(value, tag):
+  return _tag_transform(value, tag, None)
+
+def _first_name(metadata, role):
+  artists = metadata.artists.get(role)
+  return artists[0].name if artists is not None else None
 
 def _title_text(metadata):
-  title = metadata.get(keys.RECORDING_TITLE)
-  if keys.OTHER_TITLES in metadata:
-    other_titles = metadata.get(keys.OTHER_TITLES)
+  title = metadata.title
+  if metadata.other_titles is not None:
+    other_titles = metadata.other_titles
     if keys.OTHER_TITLE_SUBTITLE in other_titles:
       subtitle = '; '.join(other_titles.get(keys.OTHER_TITLE_SUBTITLE))
       title += f' ({subtitle})'
 
   # If there is more than one take available, add the take number to disambiguate
-  if keys.RELATED_TAKES in metadata and keys.MATRIX_AND_TAKE_NUMBER in metadata:
-    take_number = metadata.get(keys.MATRIX_AND_TAKE_NUMBER).split('/')[1]
+  if metadata.related_takes is not None and metadata.matrix_and_take is not None:
+    take_number = metadata.matrix_and_take.split('/')[1]
     title += f' (take {take_number})'
 
   return title
 
 def _alias(performer):
-  name = performer.get(keys.REF_NAME)
-  alias = performer.get(keys.REF_ALIAS)
+  name = performer.name
+  alias = performer.alias
   if alias:
     aname = alias if type(alias) == str \
-        else alias.get(keys.REF_NAME)
+        else alias.name
     name = f'{aname} ({name})'
   return name
 
 def _performer_list(metadata):
-  artists = metadata.get(keys.ARTISTS)
+  artists = metadata.artists
   performers = []
 
   # Sometimes the LoCJ will list every musician in an orchestra *individually*,
@@ -65,45 +68,39 @@ def title(metadata):
   return id3.TIT2(text=_title_text(metadata))
 
 def date(metadata):
-  return _tag(metadata, id3.TDRC, keys.RECORDING_DATE)
+  return _tag(metadata.date, id3.TDRC)
 
 def language(metadata):
-  return _tag(metadata, id3.TLAN, keys.LANGUAGE)
+  return _tag(metadata.language, id3.TLAN)
 
 def length(metadata):
-  return _tag(metadata, id3.TLEN, keys.DURATION)
+  return _tag(metadata.duration, id3.TLEN)
 
 def composer(metadata):
-  return _tag_transform(metadata, id3.TCOM,
-      lambda artists: artists[0][keys.REF_NAME],
-      keys.ARTISTS, keys.ARTIST_COMPOSER)
+  return _tag(_first_name(metadata, keys.ARTIST_COMPOSER), id3.TCOM)
 
 def lyricist(metadata):
-  return _tag_transform(metadata, id3.TEXT,
-      lambda artists: artists[0][keys.REF_NAME],
-      keys.ARTISTS, keys.ARTIST_LYRICIST)
+  return _tag(_first_name(metadata, keys.ARTIST_LYRICIST), id3.TEXT)
 
 def album(metadata):
-  album = metadata.get(keys.LABEL_NAME_AND_NUMBER)
-  return id3.TALB(text=album)
+  return _tag(metadata.label, id3.TALB)
 
 def lead_performer(metadata):
   return id3.TPE1(text=_performer_list(metadata)) # Remove the trailing semicolon
 
 def track_number(metadata):
-  return _tag_transform(metadata, id3.TRCK, lambda i: str(i), keys.ID)
+  return _tag_transform(metadata.id, id3.TRCK, lambda i: str(i))
 
 def genre(metadata):
-  return _tag(metadata, id3.TCON, keys.GENRES)
+  return _tag(metadata.genres, id3.TCON)
 
 def comments(metadata):
-  if keys.NOTES in metadata:
-    return id3.COMM(text=metadata[keys.NOTES], desc='Notes', lang='eng')
+  if metadata.notes is not None:
+    return id3.COMM(text=metadata.notes, desc='Notes', lang='eng')
   return None
 
 def publisher(metadata):
-  return _tag_transform(metadata, id3.TPUB,
-      lambda s: s.split(' ')[0], keys.LABEL_NAME_AND_NUMBER)
+  return _tag_transform(metadata.label, id3.TPUB, lambda s: s.split(' ')[0])
 
 def fix_filename(filename):
   filename = filename.replace(':', ' -') # best to keep colons out of filenames
@@ -111,15 +108,16 @@ def fix_filename(filename):
   return filename
 
 def filename(metadata, artist_metadata=None):
-  filename = f'{metadata.get(keys.ID)} - {_performer_list(metadata)} - {_title_text(metadata)}' \
-    if keys.ARTISTS in metadata \
-    else f'{metadata.get(keys.ID)} - {_alias(artist_metadata)} - {metadata.get(keys.TITLE)}'
+  filename = f'{metadata.id} - {_performer_list(metadata)} - {_title_text(metadata)}' \
+    if metadata.artists is not None \
+    else f'{metadata.id} - {_alias(artist_metadata)} - {metadata.row_title}'
   return fix_filename(filename)
 
+# `metadata` is a Recording (with its artists) or an Artist
 def dirname(metadata):
-  filename = f'{metadata.get(keys.ID)} - {_performer_list(metadata)}' \
-    if keys.ARTISTS in metadata \
-    else f'{metadata.get(keys.ID)} - {_alias(metadata)}' # shallow
+  filename = f'{metadata.id} - {_performer_list(metadata)}' \
+    if isinstance(metadata, Recording) \
+    else f'{metadata.id} - {_alias(metadata)}'
   return fix_filename(filename)
 
 tag_makers = [
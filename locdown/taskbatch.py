@@ -1,32 +1,108 @@
-import asyncio
+import asyncio, contextlib
 
+from .concurrency import new_group
+
+# Runs a batch of awaitables with at most `limit` of them in flight at once.
+# Tasks are pulled lazily from the `tasks` iterable by a pool of `limit`
+# workers, so coroutines are only created as capacity frees up. Iterating over
+# a batch (`async for result in batch`) yields results in completion order;
+# `run()` instead returns them all, in the order of `tasks`.
+#
+# `limit` may also be an AdaptiveLimiter (see concurrency.py), in which case
+# the number of tasks in flight follows its current limit.
+#
+# Each task is a group of its own to the session's scheduler (see
+# concurrency.py), so tasks that fan out share requests fairly with the rest.
 class TaskBatch:
-  def __init__(self, tasks, limit=None, monitor=None, monitor_interval=1):
-    self.tasks = list(tasks)
-    self.limit = limit or len(self.tasks)
+  _DONE = object()
+
+  def __init__(self, tasks, limit=None, monitor=None, monitor_interval=1, total=None):
+    if total is None and hasattr(tasks, '__len__'):
+      total = len(tasks)
+    if not limit:
+      tasks = list(tasks)
+      total = len(tasks)
+      limit = total
+
+    self.limiter = limit if hasattr(limit, 'maximum') else None
+    self.tasks = enumerate(tasks)
+    self.limit = max(self.limiter.maximum if self.limiter else limit, 1)
+    self.num_running = 0
     self.monitor = monitor
     self.monitor_interval = monitor_interval
     self.state = type('state', (), {
       'num_done': 0,
-      'num_total': len(self.tasks) })
+      'num_total': total or 0 })
 
-  async def run(self):
-    semaphore = asyncio.Semaphore(self.limit)
-    async def run_task(task):
-      async with semaphore:
-        result = await task
-        self.state.num_done += 1
-        return result
+  async def _indexed_results(self):
+    results = asyncio.Queue(maxsize=self.limit)
+
+    capacity = asyncio.Condition()
+
+    async def worker():
+      try:
+        while True:
+          if self.limiter:
+            async with capacity:
+              await capacity.wait_for(lambda: self.num_running < self.limiter.limit)
+          try:
+            index, task = next(self.tasks)
+          except StopIteration:
+            break
+
+          self.num_running += 1
+          try:
+            with new_group():
+              result = await task
+          finally:
+            self.num_running -= 1
+            if self.limiter:
+              async with capacity:
+                capacity.notify_all()
+
+          self.state.num_done += 1
+          await results.put((index, result))
+        await results.put(self._DONE)
+      except Exception as e:
+        await results.put(e)
 
     async def monitor_task():
-      while self.state.num_done < self.state.num_total:
-        self.monitor(self.state)
+      while True:
+        if self.state.num_done < self.state.num_total:
+          self.monitor(self.state)
         await asyncio.sleep(self.monitor_interval)
+
+    workers = [ asyncio.ensure_future(worker()) for _ in range(self.limit) ]
+    helpers = [ asyncio.ensure_future(monitor_task()) ] if self.monitor else []
+
+    try:
+      num_running = len(workers)
+      while num_running:
+        item = await results.get()
+        if item is self._DONE:
+          num_running -= 1
+        elif isinstance(item, Exception):
+          raise item
+        else:
+          yield item
+    finally:
+      for task in workers + helpers:
+        task.cancel()
+      with contextlib.suppress(asyncio.CancelledError):
+        await asyncio.gather(*workers, *helpers, return_exceptions=True)
+
+    if self.monitor and self.state.num_total:
       self.monitor(self.state)
 
-    tasks = [ run_task(task) for task in self.tasks ]
-    if self.monitor:
-      tasks.append(monitor_task())
+  async def _results(self):
+    async for _, result in self._indexed_results():
+      yield result
+
+  def __aiter__(self):
+    return self._results()
 
-    results = await asyncio.gather(*tasks)
-    return results[:-1] if self.monitor else results
+  async def run(self):
+    results = {}
+    async for index, result in self._indexed_results():
+      results[index] = result
+    return [ results[i] for i in sorted(results) ]
@@ -1,4 +1,4 @@
-import functools, operator, os, sys, subprocess
+import itertools, os, sys, subprocess
 
 def eprint(*args, **kwargs):
   print(*args, file=sys.stderr, **kwargs)
@@ -37,7 +37,7 @@ def confirm(default=None):
   return result
 
 def flatten(l):
-  return functools.reduce(operator.add, l, [])
+  return list(itertools.chain.from_iterable(l))
 
 def open_urls(urls):
   if sys.platform == 'win32':
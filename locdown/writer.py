@@ -0,0 +1,125 @@
+import asyncio, importlib.util, json, os, pathlib, queue, threading
+
+from .jukebox.models import to_json
+from .config import FSYNC_ALWAYS, FSYNC_BATCH, FSYNC_NEVER, FSYNC_POLICIES
+from . import util
+
+DEFAULT_QUEUE_SIZE = 256 # Files waiting to be written before writers must wait
+MAX_BATCH_SIZE = 64 # Files written between fsyncs with FSYNC_BATCH
+
+# Serializes metadata (models or plain dicts) to the bytes of a JSON file:
+# indented with sorted keys, as `scrape` prints it, or on a single line if
+# `compact`. orjson is used if it is installed, falling back to the json
+# module for anything it can't encode (e.g. integers too large for 64 bits);
+# the output is the same either way.
+def make_encoder(compact=False):
+  def encode_json(obj):
+    separators = (',', ':') if compact else None
+    return (json.dumps(obj, indent=None if compact else 2, separators=separators,
+                       sort_keys=True, ensure_ascii=False, default=to_json) + '\n') \
+        .encode('utf-8')
+
+  if not importlib.util.find_spec('orjson'):
+    return encode_json
+
+  import orjson
+  option = orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE | \
+      (0 if compact else orjson.OPT_INDENT_2)
+  def encode(obj):
+    try:
+      return orjson.dumps(obj, option=option, default=to_json)
+    except TypeError:
+      return encode_json(obj)
+  return encode
+
+# Writes JSON files on a thread of its own, so that scraping never waits on
+# the disk. Files are queued with `write_json` and written in the order they
+# were queued, in batches of whatever has queued up since the last batch.
+# Once `queue_size` files are waiting, `write_json` waits for room.
+#
+# `fsync` is one of FSYNC_POLICIES: whether files are flushed to disk never
+# (leaving it to the OS), once per batch, or as each is written.
+#
+# Failed writes don't stop the others; they are reported as warnings when the
+# writer is closed, which waits for everything queued to be written.
+class Writer:
+  def __init__(self, compact=False, fsync=FSYNC_NEVER, queue_size=DEFAULT_QUEUE_SIZE):
+    self.encode = make_encoder(compact)
+    self.fsync = fsync
+    self.queue = queue.Queue(queue_size)
+    self.dirs = set()
+    self.errors = []
+    self.thread = threading.Thread(target=self._run, name='locdown-writer', daemon=True)
+    self.thread.start()
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.close()
+
+  # `obj` must not be modified after it is queued
+  async def write_json(self, path, obj):
+    item = (pathlib.Path(str(path) + '.json'), obj)
+    try:
+      self.queue.put_nowait(item)
+    except queue.Full:
+      await asyncio.to_thread(self.queue.put, item)
+
+  async def close(self):
+    await asyncio.to_thread(self.queue.put, None)
+    await asyncio.to_thread(self.thread.join)
+    for path, e in self.errors:
+      util.eprint(f'warning: Failed to write {path}: {str(e)}')
+
+  def _run(self):
+    while True:
+      batch = [ self.queue.get() ]
+      while batch[-1] is not None and len(batch) < MAX_BATCH_SIZE:
+        try:
+          batch.append(self.queue.get_nowait())
+        except queue.Empty:
+          break
+
+      self._write_batch([ item for item in batch if item is not None ])
+      if batch[-1] is None:
+        return
+
+  # Returns the file if it has yet to be fsynced, with FSYNC_BATCH
+  def _write(self, path, obj):
+    if not path.parent in self.dirs:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      self.dirs.add(path.parent)
+
+    data = self.encode(obj)
+    f = path.open('wb')
+    try:
+      f.write(data)
+      f.flush()
+      if self.fsync == FSYNC_ALWAYS:
+        os.fsync(f.fileno())
+    except:
+      f.close()
+      raise
+
+    if self.fsync != FSYNC_BATCH:
+      f.close()
+      return None
+    return f
+
+  def _write_batch(self, batch):
+    unsynced = []
+    for path, obj in batch:
+      try:
+        f = self._write(path, obj)
+        if f:
+          unsynced.append((path, f))
+      except (OSError, TypeError, ValueError) as e:
+        self.errors.append((path, e))
+
+    for path, f in unsynced:
+      with f:
+        try:
+          os.fsync(f.fileno())
+        except OSError as e:
+          self.errors.append((path, e))
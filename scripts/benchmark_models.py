@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Compares the memory used by scraped recordings held as plain dicts, as they
+# used to be, and as Recording models (see locdown/jukebox/models.py). Each
+# record is decoded from its own JSON, so that, as when scraping, no two
+# records share any strings until the models intern them.
+#
+#   python scripts/benchmark_models.py [--records N]
+
+import argparse, gc, json, pathlib, sys, tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from locdown.jukebox import keys
+from locdown.jukebox.models import Recording
+
+DEFAULT_RECORDS = 10000
+ROLES = [ 'Tenor vocal', 'Soprano vocal', 'Instrumentalist', 'Musical group', 'Composer',
+          'Lyricist', 'Conductor' ]
+GENRES = [ 'Classical music', 'Popular music', 'Ethnic music', 'Spoken word' ]
+LANGUAGES = [ 'English', 'Italian', 'German', 'French', 'Spanish' ]
+
+def make_record(id_):
+  artist = lambda n: { keys.REF_LINK: f'https://www.loc.gov/jukebox/artists/detail/id/{n}',
+                       keys.REF_NAME: f'Artist {n}' }
+  return {
+      keys.ID: id_,
+      keys.REF_LINK: f'https://www.loc.gov/jukebox/recordings/detail/id/{id_}',
+      keys.IMAGE_LINK: f'https://www.loc.gov/jukebox/media/take/images/{id_}.jpg',
+      keys.ARTISTS: { ROLES[(id_ + i) % len(ROLES)]: [ artist(id_ % 500 + i) ]
+                      for i in range(3) },
+      keys.RECORDING_TITLE: f'Recording {id_}',
+      keys.OTHER_TITLES: { keys.OTHER_TITLE_SUBTITLE: [ f'Subtitle {id_}' ] },
+      keys.RECORDING_DATE: f'19{id_ % 30 + 10}-01-01',
+      keys.DURATION: '3:12',
+      keys.GENRES: GENRES[id_ % len(GENRES)],
+      keys.LANGUAGE: LANGUAGES[id_ % len(LANGUAGES)],
+      keys.CATEGORY: 'Vocal',
+      keys.LABEL_NAME_AND_NUMBER: f'Victor {id_}',
+      keys.MATRIX_AND_TAKE_NUMBER: f'B-{id_}/1',
+      keys.NOTES: 'Orchestra conducted by Walter B. Rogers.',
+      keys.PLACE_OF_RECORDING: 'Camden, New Jersey',
+      keys.RELATED_TAKES: [ { keys.REF_LINK:
+          f'https://www.loc.gov/jukebox/recordings/detail/id/{id_ + 1}',
+          keys.REF_NAME: f'Victor matrix B-{id_}. Recording {id_} / Artist {id_}' } ],
+      keys.SIZE: '10 in.',
+  }
+
+def measure(n, convert):
+  sources = [ json.dumps(make_record(id_)) for id_ in range(n) ]
+  gc.collect()
+  tracemalloc.start()
+  records = [ convert(json.loads(source)) for source in sources ]
+  gc.collect()
+  size, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return size, records
+
+def main():
+  parser = argparse.ArgumentParser(description='Measure the memory used by scraped recordings.')
+  parser.add_argument('-n', '--records', type=int, default=DEFAULT_RECORDS, help=
+      f'The number of recordings to hold. Defaults to {DEFAULT_RECORDS}.')
+  args = parser.parse_args()
+
+  dict_size, dicts = measure(args.records, lambda d: d)
+  model_size, models = measure(args.records, Recording.from_dict)
+  assert [ model.to_dict() for model in models ] == dicts
+
+  print(f'{args.records} recordings:')
+  print(f'  dicts:  {dict_size / 2**20:6.1f} MiB ({dict_size // args.records} bytes each)')
+  print(f'  models: {model_size / 2**20:6.1f} MiB ({model_size // args.records} bytes each), ' + \
+        f'{1 - model_size / dict_size:.0%} less')
+
+if __name__ == '__main__':
+  main()
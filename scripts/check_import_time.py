@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+# Checks that the CLI starts quickly: that commands which don't need them
+# don't import the heavy dependencies (aiohttp, bs4, mutagen, ...), and that
+# what they do import stays within a time budget, as measured by
+# `python -X importtime`. The budget excludes the standard library modules
+# every command needs anyway (asyncio and argparse), whose import time varies
+# a lot between machines. Exits with status 1 if either check fails.
+#
+#   python scripts/check_import_time.py [--budget MS] [--runs N]
+
+import argparse, pathlib, subprocess, sys
+
+DEFAULT_BUDGET = 50 # In milliseconds, on top of BASELINE_MODULES
+DEFAULT_RUNS = 10 # The fastest run is the one compared against the budget
+COMMANDS = [
+    ['--help'],
+    ['stream', '-p', '1234'],
+]
+FORBIDDEN_MODULES = { 'aiohttp', 'bs4', 'html5lib', 'lxml', 'selectolax', 'mutagen',
+                      'fake_useragent', 'sqlite3' }
+BASELINE_MODULES = [ 'asyncio', 'argparse' ]
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Lines look like `import time: self [us] | cumulative | imported package`,
+# with nested imports indented under the package that imported them
+def parse_importtime(output):
+  modules = {}
+  for line in output.splitlines():
+    if not line.startswith('import time:') or 'imported package' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    if not name.startswith('  '): # Top-level imports include all the others
+      modules[name.strip()] = int(cumulative)
+    else:
+      modules.setdefault(name.strip(), 0)
+  return modules
+
+def measure(args):
+  result = subprocess.run([sys.executable, '-X', 'importtime', *args],
+      cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+  modules = parse_importtime(result.stderr)
+  return sum(modules.values()) / 1000, set(modules)
+
+def main():
+  parser = argparse.ArgumentParser(description='Check the CLI\'s import time.')
+  parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+      help='Maximum import time per command, in milliseconds, not counting ' + \
+          f'{" and ".join(BASELINE_MODULES)}. Defaults to {DEFAULT_BUDGET}.')
+  parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+      help=f'Times to run each command. Defaults to {DEFAULT_RUNS}.')
+  args = parser.parse_args()
+
+  baseline = min(measure(['-c', f'import {", ".join(BASELINE_MODULES)}'])[0]
+                 for _ in range(args.runs))
+  print(f'{", ".join(BASELINE_MODULES)}: {baseline:.1f} ms')
+
+  ok = True
+  for command in COMMANDS:
+    runs = [ measure(['-m', 'locdown', *command]) for _ in range(args.runs) ]
+    elapsed = min(ms for ms, _ in runs) - baseline
+    forbidden = sorted({ name.split('.')[0] for name in runs[0][1] } & FORBIDDEN_MODULES)
+
+    status = 'ok'
+    if forbidden:
+      status = f'imports {", ".join(forbidden)}'
+    elif elapsed > args.budget:
+      status = f'over budget ({args.budget:.0f} ms)'
+    ok = ok and status == 'ok'
+    print(f'locdown {" ".join(command)}: {elapsed:+.1f} ms, {status}')
+
+  sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,54 @@
+import pathlib
+
+import pytest
+
+from locdown.jukebox import backend, keys, scraper
+
+# Pages laid out as loc.gov serves them, trimmed: a recording (with genres and
+# related takes), both pages of an artist's recordings, and the page shown
+# while the site is down for maintenance.
+FIXTURES = pathlib.Path(__file__).resolve().parent.joinpath('fixtures')
+RECORDING_URL = 'https://www.loc.gov/jukebox/recordings/detail/id/5'
+ARTIST_URL = 'https://www.loc.gov/jukebox/artists/detail/id/7'
+
+INSTALLED = [ name for name, b in backend.BACKENDS.items() if b.available() ]
+
+def fixture(name):
+  return FIXTURES.joinpath(name).read_bytes()
+
+def scrape_fixtures():
+  results = {
+    'recording': scraper.parse_recording(fixture('recording.html'), 5, RECORDING_URL).to_dict(),
+    'artist_page2': [ row.to_dict() for row in
+                      scraper.parse_artist_recordings(fixture('artist-page2.html'), True) ],
+  }
+  for shallow in (True, False):
+    metadata, num_pages = scraper.parse_artist(fixture('artist.html'), 7, ARTIST_URL, shallow)
+    results[f'artist_shallow_{shallow}'] = (metadata.to_dict(), num_pages)
+
+  with pytest.raises(RuntimeError) as e:
+    scraper.do_page_structure_sanity_check(scraper.make_soup(fixture('maintenance.html')),
+                                           RECORDING_URL)
+  results['maintenance'] = str(e.value)
+  return results
+
+@pytest.fixture
+def restore_backend():
+  yield
+  backend.configure('auto', True)
+
+@pytest.mark.parametrize('partial', [ True, False ])
+def test_backends_scrape_identically(restore_backend, partial):
+  results = {}
+  for name in INSTALLED:
+    backend.configure(name, partial)
+    results[name] = scrape_fixtures()
+
+  expected = results[INSTALLED[0]]
+  assert expected['recording'][keys.RECORDING_TITLE]
+  assert len(expected['recording'][keys.GENRES]) == 2
+  assert len(expected['recording'][keys.RELATED_TAKES]) == 2
+  assert expected['artist_shallow_True'][1] == 2
+  assert expected['maintenance'] == 'Down: For maintenance'
+  for name, result in results.items():
+    assert result == expected, f'{name} differs from {INSTALLED[0]}'
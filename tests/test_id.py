@@ -0,0 +1,26 @@
+from locdown.id import ID, IDExclusion, IDIntersection, IDRange, IDSample, IDStream, IDType
+
+R = IDType.RECORDING
+A = IDType.ARTIST
+
+def test_overlapping_specs_give_each_id_once():
+  stream = IDStream([ IDRange(5, 10, R), ID(7, R), IDRange(8, 12, R), ID(3, A),
+                      IDExclusion(IDRange(9, 9, R), R), IDRange(1, 2, A) ])
+  assert list(stream.of_type(R)) == [ 5, 6, 7, 8, 10, 11, 12 ]
+  assert list(stream) == [ ID(value, R) for value in (5, 6, 7, 8, 10, 11, 12) ] + \
+                         [ ID(value, A) for value in (1, 2, 3) ]
+  assert len(stream) == 10
+  assert stream.count(R) == 7 and stream.count(A) == 3
+
+def test_intersections_and_invalid_ids():
+  sample = IDSample(dict.fromkeys([ 40, 3, 15 ]), R)
+  stream = IDStream([ IDIntersection((IDRange(1, 20, R), sample), R), ID(4, R),
+                      IDIntersection((IDRange(1, 6, R), IDExclusion(ID(2, R), R)), R) ],
+                    invalid_ids=lambda type_: [ 4, 5, 15 ])
+  # IDs known to be invalid are only kept when given on their own
+  assert list(stream.of_type(R)) == [ 1, 3, 4, 6 ]
+
+def test_large_overlapping_ranges():
+  stream = IDStream([ IDRange(i*500, i*500 + 999, R) for i in range(400) ])
+  assert len(stream) == 200500
+  assert sum(1 for _ in stream) == 200500
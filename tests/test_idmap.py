@@ -0,0 +1,59 @@
+import asyncio
+
+from locdown.idmap import IDMap
+from locdown.jukebox import find_max_valid_id, id_exists
+from locdown.resilience import RetryPolicy
+
+# Answers requests for details pages by status alone: IDs up to `max_id`
+# exist, except those in `missing`; `statuses` overrides the status of others.
+class FakeSession:
+  def __init__(self, max_id, id_map, missing=(), statuses=None):
+    self.max_id = max_id
+    self.id_map = id_map
+    self.missing = set(missing)
+    self.statuses = statuses or {}
+    self.retry = RetryPolicy(retries=0)
+
+  def head(self, url, **kwargs):
+    id_ = int(url.rstrip('/').split('/')[-1])
+    status = self.statuses.get(id_,
+        200 if 1 <= id_ <= self.max_id and not id_ in self.missing else 404)
+    return FakeResponse(status)
+
+  get = head
+
+class FakeResponse:
+  def __init__(self, status):
+    self.status = status
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    pass
+
+def invalid(id_map, start, end):
+  return [ id_ for id_ in range(start, end+1) if id_map.is_invalid('recordings', id_) ]
+
+def test_ids_above_the_maximum_are_not_dead(tmp_path):
+  id_map = IDMap(tmp_path)
+  session = FakeSession(10300, id_map, missing=[ 10290 ])
+  assert asyncio.run(find_max_valid_id(session, 'recordings', 10330)) == 10300
+  assert invalid(id_map, 10301, 10400) == []
+
+  # A range scraped past the maximum 404s, but only until those IDs are published
+  asyncio.run(id_exists(session, 10310, 'recordings'))
+  assert invalid(id_map, 10301, 10400) == []
+
+  session.max_id = 10330
+  assert asyncio.run(find_max_valid_id(session, 'recordings', 10300)) == 10330
+  assert invalid(id_map, 10301, 10330) == []
+  assert id_map.candidates('recordings', 10301, 10330) == list(range(10301, 10331))
+
+def test_only_404s_mark_ids_invalid(tmp_path):
+  id_map = IDMap(tmp_path)
+  id_map.set_max_id('recordings', 100)
+  session = FakeSession(100, id_map, missing=[ 5 ], statuses={ 6: 403, 7: 400 })
+  for id_ in (5, 6, 7):
+    assert not asyncio.run(id_exists(session, id_, 'recordings'))
+  assert invalid(id_map, 1, 100) == [ 5 ]
@@ -0,0 +1,22 @@
+import pathlib, pickle, sys
+
+from locdown.jukebox import scraper
+
+FIXTURES = pathlib.Path(__file__).resolve().parent.joinpath('fixtures')
+RECORDING_URL = 'https://www.loc.gov/jukebox/recordings/detail/id/5'
+ARTIST_URL = 'https://www.loc.gov/jukebox/artists/detail/id/7'
+
+def fixture(name):
+  return FIXTURES.joinpath(name).read_bytes()
+
+# As when returned from a --parse-workers process
+def test_unpickled_models_are_interned():
+  recording = scraper.parse_recording(fixture('recording.html'), 5, RECORDING_URL)
+  copy = pickle.loads(pickle.dumps(recording))
+  assert copy == recording
+  assert all(genre is sys.intern(genre) for genre in copy.genres)
+  assert all(role is sys.intern(role) for role in copy.artists)
+
+  artist, _ = scraper.parse_artist(fixture('artist.html'), 7, ARTIST_URL, True)
+  copy = pickle.loads(pickle.dumps(artist))
+  assert copy == artist